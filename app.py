@@ -6,26 +6,108 @@ from io import BytesIO
 import xlsxwriter
 #import openpyxl
 import ThaiTextPrepKit
+import os
+import time
+import uuid
+import hmac
+import core
+import exports
+import jobs
 
 __version__ = '1.0J'
 
+PREVIEW_CONFIRM_SECONDS = 120
+# The download button holds the whole file in the server's memory, so larger streamed outputs are not offered.
+STREAM_DOWNLOAD_MAX_BYTES = int(os.environ.get('STREAM_DOWNLOAD_MAX_BYTES', 256 * 1024 ** 2))
+
+def remove_files(*paths):
+    for path in paths:
+        if path and os.path.exists(path):
+            os.remove(path)
+
+def discard_streamed_output():
+    remove_files(st.session_state.get('streamed_output'))
+    st.session_state.streamed_output = None
+    st.session_state.streamed_head = None
+
 def on_file_uploader_change():
     print('Change!')
     st.session_state.performed_dataframe = None
     st.session_state.perform = False
+    discard_streamed_output()
+    if st.session_state.get('preprocess_job') is not None:
+        # The job's temp files are removed when it is collected, or by the job itself if it is running.
+        get_job_scheduler().cancel(st.session_state.preprocess_job['id'])
+
+@st.cache_resource
+def get_export_manager():
+    return exports.ExportManager()
+
+@st.cache_resource
+def get_job_scheduler():
+    return jobs.JobScheduler()
+
+@st.fragment
+def preprocess_job_status(job_id):
+    """Poll this session's preprocessing job; the page stays responsive while it is queued or running."""
+    scheduler = get_job_scheduler()
+    job = scheduler.get(job_id)
+    if job is None or job.status not in ('queued', 'running'):
+        st.rerun()
+
+    if job.status == 'queued':
+        st.progress(0.0, text=f'Queued, {scheduler.position(job)} job(s) ahead')
+    else:
+        st.progress(job.progress, text=f'Operation in progress. Please wait. ({job.progress:.0%})')
+    if job.cancel_event.is_set():
+        st.caption('Cancelling...')
+    elif st.button('Cancel', key='cancel_preprocess_job', type='secondary'):
+        scheduler.cancel(job_id)
+    time.sleep(0.5)
+    st.rerun(scope='fragment')
+
+@st.fragment
+def export_button(df, fingerprint, label, export_format, file_name, mime, **options):
+    """Build an export only when asked for, in the background, and offer it once ready."""
+    manager = get_export_manager()
+    key = exports.export_key(fingerprint, export_format, **options)
+    job = manager.get(key)
+
+    if job is None or job.status == 'error':
+        if job is not None:
+            st.error(f'Building {label} failed: {job.error}', icon="⚠️")
+        if not st.button(f'Prepare {label}', key=f'prepare_{export_format}', type='secondary'):
+            return
+        job = manager.submit(key, exports.BUILDERS[export_format], df, **options)
+
+    if job.status == 'running':
+        st.progress(job.progress, text=f'Building {label}...')
+        time.sleep(0.5)
+        st.rerun(scope='fragment')
+    elif job.status == 'done':
+        st.download_button(f'Donwload {label}',
+                           data=job.data,
+                           file_name=file_name,
+                           mime=mime,
+                           type='secondary',
+                           key=f'download_{export_format}')
 
 st.header(f"Text Preprocessing {__version__} 🥳")
 st.write("Thai language preprocessing for any downstream tasks")
 st.write(f'Text Preprocessing Version: {ThaiTextPrepKit.__version__}')
 
 # Insert containers separated into tabs:
-tab1, tab2, tab3, tab4 = st.tabs(["Text Preprocessing", "Data View", "Test Here", "Pattern Replacements"])
+tab1, tab2, tab3, tab4, tab5 = st.tabs(["Text Preprocessing", "Data View", "Test Here", "Pattern Replacements", "Cache & Memory"])
 
 with tab1:
-    uploaded_file = st.file_uploader('Upload file here', type=['csv', 'xlsx'],
+    uploaded_file = st.file_uploader('Upload file here', type=['csv', 'xlsx', 'parquet', 'arrow', 'feather', 'ipc'],
                     accept_multiple_files=False,
                     on_change=on_file_uploader_change,
-                    help='อัปโหลดไฟล์ในรูปแบบ .csv หรือ .xlsx (ได้ครั้งละ 1 ไฟล์)')
+                    help='อัปโหลดไฟล์ในรูปแบบ .csv, .xlsx, .parquet หรือ .arrow/.feather (ได้ครั้งละ 1 ไฟล์)')
+
+    streaming_mode = st.checkbox('Streaming Mode (large CSV)',
+                                 value=False,
+                                 help='อ่านและประมวลผลไฟล์ .csv ทีละส่วน สำหรับไฟล์ขนาดใหญ่ที่โหลดทั้งไฟล์ไม่ได้ (แสดงเฉพาะตัวอย่างข้อมูล)')
 
     COLUMNS = []
     dataframe = None
@@ -38,45 +120,99 @@ with tab1:
     if 'perform' not in st.session_state:
         st.session_state.perform = False
 
-    # Function to set the variable
-    def set_performed_dataframe(value):
-        st.session_state.performed_dataframe = value
+    if 'result_store' not in st.session_state:
+        st.session_state.result_store = None
+        st.session_state.result_source = None
+
+    if 'streamed_output' not in st.session_state:
+        st.session_state.streamed_output = None
+        st.session_state.streamed_head = None
+
+    if 'preprocess_job' not in st.session_state:
+        st.session_state.preprocess_job = None
+
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+
+    selected_sheet, load_columns = None, []
 
     if uploaded_file is not None:
         try:
             file_type = uploaded_file.type
-            if file_type == 'text/csv':
+            file_extension = os.path.splitext(uploaded_file.name)[1].lower()
+            if file_extension == '.parquet':
+                dataframe = utils.load_uploaded_file(uploaded_file=uploaded_file,
+                                                     file_type='parquet')
+
+            elif file_extension in ('.arrow', '.feather', '.ipc'):
+                dataframe = utils.load_uploaded_file(uploaded_file=uploaded_file,
+                                                     file_type='ipc')
+
+            elif file_type == 'text/csv' and streaming_mode:
+                dataframe = utils.load_uploaded_file(uploaded_file=uploaded_file,
+                                                     file_type='csv_sample')
+
+            elif file_type == 'text/csv':
                 dataframe = utils.load_uploaded_file(uploaded_file=uploaded_file,
                                                      file_type=file_type) #pl.read_csv(uploaded_file)
 
             elif file_type == 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet':
-                workbook = utils.load_uploaded_file(uploaded_file=uploaded_file,
-                                                    file_type=file_type) #openpyxl.load_workbook(uploaded_file)
+                sheets = utils.load_uploaded_file(uploaded_file=uploaded_file,
+                                                  file_type=file_type)
                 
                 selected_sheet = st.selectbox(
                     "Select sheet",
-                    workbook.sheetnames,
+                    [sheet['name'] for sheet in sheets],
                     index=0,
                     help='เลือกชีทที่ต้องการ',
                     #placeholder="Select sheet...",
                 )
 
                 if selected_sheet:
-                    dataframe = utils.load_uploaded_file(uploaded_file=uploaded_file,
-                                                        file_type='excel',
-                                                        selected_sheet=selected_sheet) 
+                    sheet = next(sheet for sheet in sheets if sheet['name'] == selected_sheet)
+                    if sheet['rows'] is not None:
+                        st.caption(f"~{sheet['rows']:,} rows x {sheet['columns']:,} columns")
+
+                    sheet_columns = utils.load_uploaded_file(uploaded_file=uploaded_file,
+                                                             file_type='excel_columns',
+                                                             selected_sheet=selected_sheet)
+                    load_columns = st.multiselect('Columns to load',
+                                                  sheet_columns,
+                                                  help='เลือกเฉพาะคอลัมน์ที่ต้องการโหลด')
+                    load_all_columns = st.checkbox('Load all columns',
+                                                   value=False,
+                                                   disabled=bool(load_columns),
+                                                   help='โหลดทุกคอลัมน์ของชีท (ใช้เวลาและหน่วยความจำมากกับไฟล์ขนาดใหญ่)')
+
+                    # Nothing is read until the columns are chosen, so a large sheet is never loaded whole by accident.
+                    if load_columns or load_all_columns:
+                        dataframe = utils.load_uploaded_file(uploaded_file=uploaded_file,
+                                                            file_type='excel',
+                                                            selected_sheet=selected_sheet,
+                                                            columns=load_columns)
+                    else:
+                        st.info('Select the columns to load, or tick "Load all columns".', icon="📋")
                                 #pl.read_excel(uploaded_file,
                                 #            sheet_name=selected_sheet,
                                 #            engine='calamine')
 
-            st.write('Sample data')
-            st.dataframe(dataframe.head(5))
-            #st.data_editor(dataframe.head(5),
-            #               disabled=True)
-            
-            COLUMNS = dataframe.columns
+            if dataframe is not None:
+                st.write('Sample data')
+                st.dataframe(dataframe.head(5))
+                #st.data_editor(dataframe.head(5),
+                #               disabled=True)
 
-            st.session_state.perform = True
+                COLUMNS = dataframe.columns
+
+                # Results are kept per source frame; only re-hash it when the upload or its load options change.
+                source_key = (uploaded_file.file_id, file_type, streaming_mode, selected_sheet, tuple(load_columns))
+                if st.session_state.result_source != source_key:
+                    fingerprint = utils.hash_dataframe(dataframe)
+                    if st.session_state.result_store is None or st.session_state.result_store.fingerprint != fingerprint:
+                        st.session_state.result_store = utils.ResultStore(fingerprint)
+                    st.session_state.result_source = source_key
+
+            st.session_state.perform = dataframe is not None
 
         except Exception as error:
             st.write(error)
@@ -126,6 +262,23 @@ with tab1:
                                     value='/()',
                                     help='เพิ่มอักขระพิเศษที่ไม่ต้องการให้ตัดทิ้ง')
 
+    deduplicate = st.checkbox('Deduplicate Texts',
+                                value=True,
+                                help='ประมวลผลเฉพาะข้อความที่ไม่ซ้ำกัน แล้วนำผลลัพธ์กลับไปใส่ทุกแถวที่มีข้อความเดียวกัน')
+
+    use_disk_cache = st.checkbox('Use Disk Cache',
+                                value=True,
+                                disabled=not deduplicate,
+                                help='เก็บผลลัพธ์ของข้อความที่เคยประมวลผลแล้วไว้ในดิสก์ เพื่อใช้ซ้ำในการอัปโหลดครั้งถัดไป')
+
+    scheduler = get_job_scheduler()
+
+    workers = st.number_input('Workers',
+                              min_value=1,
+                              max_value=scheduler.max_workers,
+                              value=scheduler.max_workers,
+                              help='จำนวนโปรเซสสูงสุดที่งานนี้ใช้ได้พร้อมกัน จากพูลโปรเซสที่ใช้ร่วมกันทุกผู้ใช้')
+
     spec_patterns = st.selectbox(
         "Select Specific Pattern",
         ('default', 'natural', 'corporate'),
@@ -136,78 +289,264 @@ with tab1:
     st.info('default: The default pattern transforms the text for optimal data analysis and visualization.', icon="✨")
     st.info('natural: The natural pattern modifies and corrects the text while maintaining its original, smooth feel, making it ideal for real-world presentations.', icon="🍃")
 
-    perform_ready = not st.session_state.perform
+    compare_patterns = st.selectbox(
+        "Compare with Pattern",
+        (None, 'default', 'natural', 'corporate'),
+        index=0,
+        format_func=lambda patterns: 'None' if patterns is None else patterns,
+        help='ประมวลผลอีกชุดรูปแบบหนึ่งเพื่อเปรียบเทียบผลลัพธ์คู่กัน (คำนวณเฉพาะคอลัมน์ที่ยังไม่เคยประมวลผล)',
+    )
+    if compare_patterns == spec_patterns:
+        compare_patterns = None
+
+    output_columns = [col + output_suffix for col in text_columns]
+
+    streaming = streaming_mode and uploaded_file is not None and uploaded_file.type == 'text/csv'
+
+    result_options = dict(keep_stopwords=remain_stopwords,
+                          keep_format=remain_format,
+                          return_token_list=return_token_list,
+                          include_pattern=include_pattern,
+                          lower_case=lowercase,
+                          patterns=spec_patterns)
+    run_options = dict(deduplicate=deduplicate,
+                       use_disk_cache=use_disk_cache,
+                       workers=workers)
+    option_sets = [result_options]
+    outputs = [(col, result_options, output) for col, output in zip(text_columns, output_columns)]
+    if compare_patterns is not None:
+        compare_options = dict(result_options, patterns=compare_patterns)
+        option_sets.append(compare_options)
+        outputs += [(col, compare_options, f'{output}_{compare_patterns}')
+                    for col, output in zip(text_columns, output_columns)]
+
+    store = st.session_state.result_store
+    preview_estimate = None
+    preview_enabled = st.checkbox('Sample Preview',
+                                  value=True,
+                                  disabled=streaming,
+                                  help='ประมวลผลตัวอย่างข้อมูลแบบสุ่มก่อน เพื่อตรวจสอบผลลัพธ์และประมาณเวลา/หน่วยความจำที่ใช้กับทั้งไฟล์')
+    preview_rows = st.number_input('Preview sample size',
+                                   min_value=50,
+                                   max_value=5_000,
+                                   value=core.PREVIEW_SAMPLE_ROWS,
+                                   step=50,
+                                   disabled=not preview_enabled or streaming,
+                                   help='จำนวนแถวตัวอย่าง (สุ่มแบบแบ่งชั้นตามความยาวข้อความ)')
+
+    if preview_enabled and not streaming and dataframe is not None and store is not None and text_columns:
+        missing_pairs = [(col, options) for options in option_sets for col in store.missing(text_columns, options)]
+        if missing_pairs:
+            preview, estimate = utils.preview_sample(dataframe,
+                                                     store.fingerprint,
+                                                     text_columns,
+                                                     output_columns,
+                                                     n=preview_rows,
+                                                     deduplicate=deduplicate,
+                                                     workers=workers,
+                                                     **result_options)
+            with st.expander(f"Preview ({estimate['sample_rows']:,} sampled rows, {spec_patterns})", expanded=True):
+                st.dataframe(preview.select(column for pair in zip(text_columns, output_columns) for column in pair),
+                             use_container_width=True)
+                for col in text_columns:
+                    column_estimate = estimate['columns'][col]
+                    st.caption(f"{col}: {column_estimate['texts']:,} texts to process "
+                               f"({column_estimate['unique_ratio']:.0%} unique), ~{column_estimate['seconds']:.1f}s, "
+                               f"~{column_estimate['memory_bytes'] / 1024 ** 2:,.0f} MB output")
+            # Other pattern sets are assumed to cost about the same per text.
+            preview_estimate = {
+                'seconds': sum(estimate['columns'][col]['seconds'] for col, _ in missing_pairs),
+                'memory_bytes': sum(estimate['columns'][col]['memory_bytes'] for col, _ in missing_pairs),
+            }
+            st.caption(f"Estimated full run: ~{preview_estimate['seconds']:.0f}s, "
+                       f"~{preview_estimate['memory_bytes'] / 1024 ** 2:,.0f} MB")
+
+    confirm_needed = preview_estimate is not None and preview_estimate['seconds'] > PREVIEW_CONFIRM_SECONDS
+    confirmed = True
+    if confirm_needed:
+        st.warning(f"The full run is estimated to take about {preview_estimate['seconds'] / 60:.0f} minutes. "
+                   'Check the preview before running the whole file.', icon="⏳")
+        confirmed = st.checkbox('Run the full file anyway', value=False, key='confirm_full_run')
+
+    pending_job = st.session_state.preprocess_job
+    job = scheduler.get(pending_job['id']) if pending_job is not None else None
+    if pending_job is not None and (job is None or job.status not in ('queued', 'running')):
+        scheduler.pop(pending_job['id'])
+        st.session_state.preprocess_job = None
+        if pending_job['kind'] == 'stream':
+            remove_files(pending_job['source'])
+            if job is None or job.status != 'done':
+                remove_files(pending_job['output_path'])
+
+        if job is None:
+            st.write('⚠️ Preprocessing job expired, please perform again.')
+        elif job.status == 'error':
+            st.write(f'⚠️ Exception Occur: {job.error}')
+        elif job.status == 'cancelled':
+            st.write('Preprocessing cancelled.')
+        elif pending_job['kind'] == 'stream':
+            st.session_state.streamed_output = pending_job['output_path']
+            st.session_state.streamed_head = job.result['head']
+            st.caption(f"Processed {job.result['rows']:,} rows in {job.result['chunks']} chunks, took {job.result['elapsed']:.1f}s")
+        else:
+            st.caption(f"Processed {job.result['computed']} column(s), reused {job.result['reused']}, took {job.elapsed:.1f}s")
+            store = st.session_state.result_store
+            if store is not None and store.nbytes() > store.max_bytes:
+                st.warning(f'These results ({store.nbytes() / 1024 ** 2:,.0f} MB) exceed the result memory budget '
+                           f'({store.max_bytes / 1024 ** 2:,.0f} MB). Older results will be dropped on the next run.', icon="⚠️")
+
+    perform_ready = not st.session_state.perform or st.session_state.preprocess_job is not None or not confirmed
 
     perform_button = st.button("Perform Preprossing", 
                             type="primary",
                             key='perform_button',
                             disabled=perform_ready)
 
-    output_columns = [col + output_suffix for col in text_columns]
 
-    if perform_button:
+    if perform_button and streaming:
+        discard_streamed_output()
+        source = utils.spool_upload(uploaded_file)
+        output_path = source[:-len('.csv')] + '_preprocessed.csv.gz'
+        # Row count is unknown before streaming; estimate ~100 bytes per row for the large job cap.
+        job = scheduler.submit(st.session_state.session_id,
+                               core.stream_preprocess_csv,
+                               source,
+                               output_path,
+                               input_cols=text_columns,
+                               output_cols=output_columns,
+                               size=uploaded_file.size // 100 * len(text_columns),
+                               remove_source=True,
+                               **result_options,
+                               **run_options)
+        st.session_state.preprocess_job = {'id': job.id, 'kind': 'stream', 'source': source, 'output_path': output_path}
+
+    elif perform_button:
         if dataframe is not None:
-            #try:
-            progress_text = "Operation in progress. Please wait."
-            progress_bar = st.progress(0, text=progress_text)
-            for i, text_column in enumerate(text_columns):
-                progress_bar.progress(i + 1, text=progress_text)
-                performed_dataframe = utils.preprocess(df=st.session_state.performed_dataframe if st.session_state.performed_dataframe is not None else dataframe,
-                                input_col=text_column,
-                                output_col=output_columns[i],
-                                custom_dict=None,
-                                keep_stopwords=remain_stopwords,
-                                keep_format=remain_format,
-                                return_token_list=return_token_list,
-                                include_pattern=include_pattern,
-                                lower_case=lowercase,
-                                patterns=spec_patterns)
-                
-                set_performed_dataframe(performed_dataframe)
+            missing = sum(len(store.missing(text_columns, options)) for options in option_sets)
+            if missing:
+                job = scheduler.submit(st.session_state.session_id,
+                                       core.preprocess_missing,
+                                       dataframe,
+                                       input_cols=text_columns,
+                                       option_sets=option_sets,
+                                       store=store,
+                                       size=dataframe.height * missing,
+                                       **run_options)
+                st.session_state.preprocess_job = {'id': job.id, 'kind': 'columns'}
 
-                #st.data_editor(dataframe[output_column].head(5),
-                #               disabled=True)
+        else:
+            st.write('⚠️ Upload file first!')
+
+    if st.session_state.preprocess_job is not None:
+        preprocess_job_status(st.session_state.preprocess_job['id'])
 
-            #except Exception as error:
-            #    st.write(f'⚠️ Exception Occur: {error}')
-            progress_bar.empty()
+    if streaming and st.session_state.streamed_output is not None:
+        if st.session_state.get('streamed_head') is not None:
+            st.dataframe(st.session_state.streamed_head)
 
+        streamed_size = os.path.getsize(st.session_state.streamed_output)
+        if streamed_size > STREAM_DOWNLOAD_MAX_BYTES:
+            st.warning(f'The compressed output ({streamed_size / 1024 ** 2:,.0f} MB) is over the download limit '
+                       f'({STREAM_DOWNLOAD_MAX_BYTES / 1024 ** 2:,.0f} MB). Run it with `cli.py --stream` instead.', icon="⚠️")
         else:
-            st.write('⚠️ Upload file first!')
+            def read_streamed_output(path=st.session_state.streamed_output):
+                with open(path, 'rb') as streamed_file:
+                    return streamed_file.read()
+
+            # Deferred: the file is only read when the button is clicked, not on every rerun.
+            download_streamed_csv = st.download_button('Donwload .CSV.GZ',
+                                                       data=read_streamed_output,
+                                                       file_name="preprocess_text.csv.gz",
+                                                       mime="application/gzip",
+                                                       type='secondary')
+
+    # The result frame is assembled from the store whenever every selected (column, options) pair is there,
+    # so switching back to options that were already processed needs no re-run. It shares the
+    # buffers of `dataframe` and the stored results, so keeping it in session state costs no copy.
+    st.session_state.performed_dataframe = None
+    if dataframe is not None and store is not None and text_columns and not streaming:
+        st.session_state.performed_dataframe = store.frame(dataframe, outputs)
+        if st.session_state.performed_dataframe is not None:
+            st.session_state.performed_fingerprint = store.frame_fingerprint(outputs)
+        elif st.session_state.preprocess_job is None:
+            st.caption('Press Perform Preprossing to process the new column/option selection.')
 
     #st.write(st.session_state.performed_dataframe)
     performed_dataframe = st.session_state.performed_dataframe
 
     if performed_dataframe is not None:
         if st.session_state.performed_dataframe is not None:# and output_columns in performed_dataframe.columns:
-            st.dataframe(performed_dataframe.select(output_columns).head(5))
-
-            download_csv = st.download_button('Donwload .CSV',
-                                                data=utils.convert_to_csv(performed_dataframe),
-                                                file_name="preprocess_text.csv",
-                                                mime="text/csv",
-                                                type='secondary')
-
-            download_xlsx = st.download_button('Donwload .XLSX',
-                                                data=utils.convert_to_xlsx(performed_dataframe),
-                                                file_name="preprocess_text.xlsx",
-                                                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                                                type='secondary')
+            result_columns = output_columns
+            if compare_patterns is not None:
+                result_columns = [column for output in output_columns for column in (output, f'{output}_{compare_patterns}')]
+            st.dataframe(performed_dataframe.select(result_columns).head(5))
+
+            for text_column, options, output in outputs:
+                stats = store.stats(text_column, options)
+                if stats is not None:
+                    st.caption(f"{output}: {stats['unique_texts']:,} unique of {stats['non_null_rows']:,} texts "
+                               f"({stats['dedup_ratio']:.0%} duplicates, {stats['cache_hits']:,} from disk cache), took {stats['elapsed']:.1f}s"
+                               + (f", saved ~{stats['time_saved']:.1f}s" if stats['time_saved'] is not None else ''))
+
+            if compare_patterns is not None:
+                for output in output_columns:
+                    differ = performed_dataframe.select(pl.col(output).ne_missing(pl.col(f'{output}_{compare_patterns}')).sum()).item()
+                    st.caption(f'{output}: {differ:,} rows differ between {spec_patterns} and {compare_patterns}')
+
+            fingerprint = st.session_state.performed_fingerprint
+            export_selected_only = st.checkbox('Export selected columns only',
+                                               value=False,
+                                               help='ส่งออกเฉพาะคอลัมน์ข้อความที่เลือกและคอลัมน์ผลลัพธ์')
+            export_columns = text_columns + [output for _, _, output in outputs] if export_selected_only else None
+
+            export_button(performed_dataframe, fingerprint, '.CSV', 'csv',
+                          file_name="preprocess_text.csv",
+                          mime="text/csv",
+                          columns=export_columns)
+
+            export_button(performed_dataframe, fingerprint, '.XLSX', 'xlsx',
+                          file_name="preprocess_text.xlsx",
+                          mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                          columns=export_columns)
+
+            parquet_compression = st.selectbox('Parquet compression',
+                                               ('zstd', 'snappy', 'lz4', 'gzip', 'uncompressed'),
+                                               index=0,
+                                               help='รูปแบบการบีบอัดไฟล์ .parquet')
+
+            export_button(performed_dataframe, fingerprint, '.PARQUET', 'parquet',
+                          file_name="preprocess_text.parquet",
+                          mime="application/vnd.apache.parquet",
+                          columns=export_columns,
+                          compression=parquet_compression)
+
+            export_button(performed_dataframe, fingerprint, '.ARROW', 'ipc',
+                          file_name="preprocess_text.arrow",
+                          mime="application/vnd.apache.arrow.file",
+                          columns=export_columns)
             
             get_html_table = st.checkbox('Get HTML compare table',
                                         value=False)
 
             if get_html_table:
-                if len(text_columns) == 1:
-                    download_html_table = st.download_button('Get HTML Table',
-                                                            data=utils.to_html_highlight_table(performed_dataframe,
-                                                                                                patterns=spec_patterns,
-                                                                                                raw_column=text_columns[0],
-                                                                                                preprocess_column=output_columns[0]),
-                                                            file_name='HTML_compare_table.html')
-                    
-                else:
-                    st.warning('HTML table currently not support text column more than 1', icon="⚠️")
+                html_pagination = st.radio('HTML pagination',
+                                           ('None', 'Pages in one file', 'Split files (.zip)'),
+                                           horizontal=True,
+                                           help='แบ่งตารางเป็นหน้า เพื่อให้เปิดไฟล์ขนาดใหญ่ได้เร็วขึ้น')
+                html_page_rows = st.number_input('Rows per page',
+                                                 min_value=100,
+                                                 value=1000,
+                                                 step=100,
+                                                 disabled=html_pagination == 'None')
+                split_pages = html_pagination == 'Split files (.zip)'
+                export_button(performed_dataframe, fingerprint, 'HTML Table', 'html',
+                              file_name='HTML_compare_table.zip' if split_pages else 'HTML_compare_table.html',
+                              mime='application/zip' if split_pages else 'text/html',
+                              patterns=spec_patterns,
+                              raw_column=text_columns,
+                              preprocess_column=output_columns,
+                              page_rows=None if html_pagination == 'None' else html_page_rows,
+                              split_pages=split_pages)
                 
             #st.balloons()
             #dataframe = performed_dataframe
@@ -262,19 +601,41 @@ with tab3:
     st.info('natural: The natural pattern modifies and corrects the text while maintaining its original, smooth feel, making it ideal for real-world presentations.', icon="🍃")
 
 
+    test_debounce_ms = st.number_input('Debounce (ms)',
+                                       min_value=0,
+                                       max_value=2000,
+                                       value=0,
+                                       step=50,
+                                       help='หน่วงเวลาก่อนประมวลผลข้อความใหม่ หากพิมพ์ต่อระหว่างนี้จะข้ามการประมวลผลรอบเก่าไป (0 = ไม่หน่วง)',
+                                       key='test_debounce_ms')
+
     if input_text:
-        series = utils.sigle_text_preprocessing(
-            text=input_text,
-            keep_stopwords=test_remain_stopwords,
-            keep_format=test_remain_format,
-            return_token_list=test_return_token_list,
-            lower_case=test_lowercase,
-            include_pattern=test_include_pattern,
-            patterns=test_spec_patterns,
-        )
+        engine = utils.get_interactive_engine()
+        test_options = dict(keep_stopwords=test_remain_stopwords,
+                            keep_format=test_remain_format,
+                            return_token_list=test_return_token_list,
+                            lower_case=test_lowercase,
+                            include_pattern=test_include_pattern)
+        if test_debounce_ms and not engine.is_cached(input_text, patterns=test_spec_patterns, **test_options):
+            # A newer keystroke requests a rerun, which Streamlit only raises at the next element
+            # call; touching an element after the sleep stops this run before the old text is processed.
+            time.sleep(test_debounce_ms / 1000)
+            st.empty()
+        explained = engine.explain(input_text, patterns=test_spec_patterns, **test_options)
 
         st.write()
-        st.write(f'Output: {series[0]}')
+        st.write(f"Output: {explained['output']}")
+
+        with st.expander('Step breakdown'):
+            timings = explained['timings']
+            st.write(f"Typo fixes ({timings['typo_fixes']:.2f} ms)")
+            if explained['typo_fixes']:
+                st.dataframe(pl.DataFrame(explained['typo_fixes']), use_container_width=True)
+            else:
+                st.caption('No pattern matched')
+            st.write(f"Output ({timings['output']:.2f} ms)")
+            st.write(f"Tokens ({timings['tokens']:.2f} ms): {explained['tokens']}")
+            st.write(f"Stopwords removed ({timings['stopwords']:.2f} ms): {explained['stopwords_removed']}")
 
 with tab4:
     st.subheader(f'You are currently using text preprocessing version: {ThaiTextPrepKit.__version__}')
@@ -283,17 +644,94 @@ with tab4:
                    use_container_width=True,
                    type='primary',)
 
-    default_tab, natural_tab, corporate_tab = st.tabs(["default", "natural", "corporate"])
+    profile_sample_rows = st.number_input('Profiling sample size',
+                                          min_value=100,
+                                          value=2000,
+                                          step=100,
+                                          help='จำนวนข้อความตัวอย่างจากไฟล์ที่อัปโหลด (คอลัมน์ที่เลือก) สำหรับวัดเวลาของแต่ละ pattern')
+    run_profile = st.checkbox('Profile patterns on uploaded data',
+                              value=False,
+                              disabled=dataframe is None or not text_columns,
+                              help='วัดเวลาและจำนวนครั้งที่แต่ละ pattern ตรงกับข้อความ เพื่อหา pattern ที่ช้า')
+    profile_texts = utils.sample_texts(dataframe, text_columns, n=profile_sample_rows) if run_profile else []
+
+    pattern_tabs = st.tabs(["default", "natural", "corporate"])
     
-    with default_tab:
-        st.dataframe(utils.get_patterns_table('default'), 
-                     use_container_width=True,
-                     )
-
-    with natural_tab:
-        st.dataframe(utils.get_patterns_table('natural'),
-                     use_container_width=True,)
-
-    with corporate_tab:
-        st.dataframe(utils.get_patterns_table('corporate'),
-                     use_container_width=True,)
\ No newline at end of file
+    for pattern_tab, pattern_name in zip(pattern_tabs, ("default", "natural", "corporate")):
+        with pattern_tab:
+            if not run_profile:
+                st.dataframe(utils.get_patterns_table(pattern_name),
+                             use_container_width=True,)
+                continue
+
+            replacements_column, profile_column = st.columns([1, 2])
+            with replacements_column:
+                st.dataframe(utils.get_patterns_table(pattern_name),
+                             use_container_width=True,)
+            with profile_column:
+                profile = utils.profile_patterns(pattern_name, profile_texts)
+                suspects = profile.drop_nulls(['suspect']).height
+                st.caption(f"{len(profile_texts):,} sample texts, {profile['total_ms'].sum():,.0f} ms in total"
+                           + (f", {suspects} backtracking suspects" if suspects else ""))
+                st.dataframe(profile,
+                             use_container_width=True,
+                             hide_index=True,)
+
+with tab5:
+    def megabytes(size):
+        return f'{size / 1024 ** 2:,.1f} MB' if size is not None else 'n/a'
+
+    st.subheader('This session')
+    store = st.session_state.get('result_store')
+    session_col1, session_col2 = st.columns(2)
+    session_col1.metric('Stored results', f'{len(store) if store is not None else 0} column(s)')
+    session_col2.metric('Result memory',
+                        megabytes(store.nbytes() if store is not None else 0),
+                        help=f'Budget {megabytes(core.RESULT_STORE_MAX_BYTES)}, least recently used results are evicted first')
+    if st.session_state.get('streamed_output') and os.path.exists(st.session_state.streamed_output):
+        st.caption(f'Streamed output file: {megabytes(os.path.getsize(st.session_state.streamed_output))}')
+
+    if st.button('Clear my results', key='clear_session_results', type='secondary'):
+        st.session_state.result_store = None
+        st.session_state.result_source = None
+        st.session_state.performed_dataframe = None
+        discard_streamed_output()
+        st.rerun()
+
+    st.subheader('Server process (shared by every session)')
+    export_stats = get_export_manager().stats()
+    text_cache_stats = utils.get_text_cache().stats()
+    job_stats = get_job_scheduler().stats()
+    server_col1, server_col2, server_col3 = st.columns(3)
+    server_col1.metric('Resident memory', megabytes(core.process_memory()))
+    server_col2.metric('Export cache', megabytes(export_stats['bytes']),
+                       help=f"{export_stats['entries']} export(s), budget {megabytes(export_stats['max_bytes'])}")
+    server_col3.metric('Disk text cache', megabytes(text_cache_stats['bytes']),
+                       help=f"{text_cache_stats['entries']:,} texts, budget {megabytes(text_cache_stats['max_bytes'])}")
+    st.caption(f"Jobs: {job_stats['running']} running, {job_stats['queued']} queued on {job_stats['max_workers']} worker processes")
+
+    st.write('st.cache_data')
+    st.dataframe(utils.cache_data_stats().with_columns((pl.col('bytes') / 1024 ** 2).alias('MB')).drop('bytes'),
+                 use_container_width=True)
+    st.caption(f'Entries expire after {utils.CACHE_TTL:,}s')
+
+    # Purging affects every session on the server, so it needs the ADMIN_PASSWORD set for the deployment.
+    admin_password = os.environ.get('ADMIN_PASSWORD')
+    if not admin_password:
+        st.caption('Purging shared caches is disabled. Set ADMIN_PASSWORD on the server to enable it.')
+    else:
+        entered_password = st.text_input('Admin password', type='password', key='admin_password',
+                                         help='รหัสผ่านผู้ดูแลระบบ สำหรับล้างแคชที่ใช้ร่วมกันทุกผู้ใช้')
+        if entered_password and hmac.compare_digest(entered_password.encode(), admin_password.encode()):
+            purge_col1, purge_col2, purge_col3 = st.columns(3)
+            if purge_col1.button('Clear data caches', key='clear_data_caches', type='secondary'):
+                utils.clear_data_caches()
+                st.rerun()
+            if purge_col2.button('Clear export cache', key='clear_export_cache', type='secondary'):
+                get_export_manager().clear()
+                st.rerun()
+            if purge_col3.button('Clear disk text cache', key='clear_text_cache', type='secondary'):
+                utils.get_text_cache().clear()
+                st.rerun()
+        elif entered_password:
+            st.error('Wrong admin password', icon="🔒")
@@ -0,0 +1,293 @@
+"""Benchmark suite and regression harness for the preprocessing pipeline.
+
+Builds a synthetic Thai corpus, times each stage (load, hash_dataframe, preprocess per
+pattern set and option set, highlight_patterns, every export format) and reports
+rows/sec and peak memory as JSON. Compare against a previous run to catch regressions.
+
+Usage:
+    python benchmark.py --rows 100000 --duplication 0.6 --output bench.json
+    python benchmark.py --rows 100000 --baseline bench.json --threshold 0.2 --memory-threshold 0.3
+    python benchmark.py --micro
+"""
+import argparse
+import json
+import platform
+import random
+import re
+import sys
+import threading
+import time
+from io import BytesIO
+
+import mmh3
+import polars as pl
+
+import core
+import exports
+
+THAI_WORDS = ['สวัสดี', 'ครับ', 'ค่ะ', 'บริการ', 'ดีมาก', 'ช้า', 'พนักงาน', 'สุภาพ', 'แอป', 'เบอร์โทร',
+              'ติดต่อ', 'ไม่ได้', 'ปัญหา', 'ระบบ', 'ล่ม', 'ขอบคุณ', 'โอนเงิน', 'บัตร', 'สาขา', 'รอนาน']
+TYPO_WORDS = ['แอพ', 'เบอโท', 'โทรสับ', 'อินเตอเนต', 'ok', 'คับ', 'ค่า', 'มั้ย']
+
+OPTION_SETS = {
+    'default': {},
+    'no_stopwords_no_format': {'keep_stopwords': False, 'keep_format': False},
+    'token_list': {'return_token_list': True},
+}
+
+EXPORT_FORMATS = ('csv', 'xlsx', 'parquet', 'ipc', 'html')
+
+
+def make_corpus(n_rows: int, duplication: float=0.5, text_length: int=80, typo_rate: float=0.1,
+                seed: int=0) -> pl.DataFrame:
+    """Synthetic Thai feedback column with a given share of duplicated rows and mean text length (characters)."""
+    rng = random.Random(seed)
+    n_unique = max(1, round(n_rows * (1 - duplication)))
+    unique_texts = []
+    for _ in range(n_unique):
+        words, length = [], 0
+        target = max(1, int(rng.gauss(text_length, text_length / 4)))
+        while length < target:
+            word = rng.choice(TYPO_WORDS if rng.random() < typo_rate else THAI_WORDS)
+            words.append(word)
+            length += len(word) + 1
+        unique_texts.append(' '.join(words))
+    texts = unique_texts + [rng.choice(unique_texts) for _ in range(n_rows - n_unique)]
+    rng.shuffle(texts)
+    return pl.DataFrame({'id': range(n_rows), 'text': texts})
+
+
+class PeakMemory:
+    """Peak resident memory above the starting point while the block runs, sampled from /proc.
+    Child processes (pool workers with `--workers` > 1) are included, so the peak covers the
+    whole run; workers already alive when the block starts count towards the starting point.
+    """
+    def __init__(self, interval: float=0.005):
+        self.interval = interval
+        self.enabled = core.process_memory() is not None
+        self.peak_mb = None
+
+    @staticmethod
+    def _rss() -> int:
+        return core.process_memory(include_children=True)
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._peak = max(self._peak, self._rss())
+
+    def __enter__(self):
+        if self.enabled:
+            self._start = self._peak = self._rss()
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.enabled:
+            self._stop.set()
+            self._thread.join()
+            self._peak = max(self._peak, self._rss())
+            self.peak_mb = (self._peak - self._start) / 1024 ** 2
+
+
+def measure(func, rows: int, repeat: int=1) -> dict:
+    """Best-of-`repeat` wall time of `func()`, with rows/sec and the peak memory of the first run."""
+    best, peak_mb = float('inf'), None
+    for i in range(repeat):
+        with PeakMemory() as memory:
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+        if i == 0:
+            peak_mb = memory.peak_mb
+    return {'seconds': best, 'rows_per_sec': rows / best if best else None, 'peak_mb': peak_mb}
+
+
+def run_suite(n_rows: int, duplication: float, text_length: int, patterns=None, workers: int=1,
+              repeat: int=1, seed: int=0) -> dict:
+    import ThaiTextPrepKit
+    df = make_corpus(n_rows, duplication=duplication, text_length=text_length, seed=seed)
+    patterns = patterns or list(core.get_available_patterns())
+    results = {}
+
+    def stage(name, func):
+        results[name] = measure(func, n_rows, repeat=repeat)
+        print(f"{name:<48} {results[name]['seconds']:>9.3f}s {results[name]['rows_per_sec'] or 0:>12,.0f} rows/s",
+              file=sys.stderr)
+
+    csv_bytes, parquet_buffer = df.write_csv().encode(), BytesIO()
+    df.write_parquet(parquet_buffer)
+    stage('load/csv', lambda: core.load_file(BytesIO(csv_bytes), 'text/csv'))
+    stage('load/parquet', lambda: core.load_file(BytesIO(parquet_buffer.getvalue()), 'parquet'))
+    stage('hash_dataframe', lambda: core.hash_dataframe(df))
+    stage('hash_dataframe/fast', lambda: core.hash_dataframe(df, fast=True))
+
+    texts = df.get_column('text').to_list()
+    for pattern_set in patterns:
+        for option_name, options in OPTION_SETS.items():
+            stage(f'preprocess/{pattern_set}/{option_name}',
+                  lambda: core.preprocess_columns(df, ['text'], ['text_pre'], patterns=pattern_set,
+                                                  workers=workers, **options))
+        pattern_list = core.get_available_patterns()[pattern_set]
+        core.get_pattern_matcher(pattern_list)
+        stage(f'highlight_patterns/{pattern_set}',
+              lambda: [core.highlight_patterns(pattern_list, text) for text in texts])
+
+    processed, _ = core.preprocess_columns(df, ['text'], ['text_pre'], patterns=patterns[0], workers=workers)
+    for export_format in EXPORT_FORMATS:
+        options = ({'patterns': patterns[0], 'raw_column': 'text', 'preprocess_column': 'text_pre'}
+                   if export_format == 'html' else {})
+        stage(f'export/{export_format}', lambda: exports.BUILDERS[export_format](processed, **options))
+
+    return {
+        'meta': {
+            'rows': n_rows,
+            'duplication': duplication,
+            'text_length': text_length,
+            'workers': workers,
+            'repeat': repeat,
+            'seed': seed,
+            'python': platform.python_version(),
+            'polars': pl.__version__,
+            'ThaiTextPrepKit': ThaiTextPrepKit.__version__,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+MEMORY_NOISE_MB = 1.0
+
+
+def compare(current: dict, baseline: dict, threshold: float=0.2, memory_threshold: float=0.3) -> list:
+    """Stages whose rows/sec dropped by more than `threshold`, or whose peak memory grew by more
+    than `memory_threshold` (fractions), against `baseline`. Peak memory growth below
+    MEMORY_NOISE_MB is ignored."""
+    regressions = []
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if not before:
+            continue
+        if before.get('rows_per_sec') and result.get('rows_per_sec'):
+            change = result['rows_per_sec'] / before['rows_per_sec'] - 1
+            if change < -threshold:
+                regressions.append({'stage': name,
+                                    'metric': 'rows_per_sec',
+                                    'baseline_rows_per_sec': before['rows_per_sec'],
+                                    'rows_per_sec': result['rows_per_sec'],
+                                    'change': change})
+        if before.get('peak_mb') is not None and result.get('peak_mb') is not None:
+            growth = result['peak_mb'] - before['peak_mb']
+            change = growth / before['peak_mb'] if before['peak_mb'] > 0 else float('inf')
+            if growth > MEMORY_NOISE_MB and change > memory_threshold:
+                regressions.append({'stage': name,
+                                    'metric': 'peak_mb',
+                                    'baseline_peak_mb': before['peak_mb'],
+                                    'peak_mb': result['peak_mb'],
+                                    'change': change})
+    return regressions
+
+
+###################################
+##### LEGACY MICRO-BENCHMARKS #####
+###################################
+def legacy_hash_dataframe(df: pl.DataFrame, seed=42) -> str:
+    """Row-by-row hash_dataframe kept as the baseline for comparison."""
+    row_hashes = df.hash_rows(seed=seed)
+    hasher = mmh3.mmh3_x64_128(seed=seed)
+    for row_hash in row_hashes:
+        hasher.update(row_hash.to_bytes(64, "little"))
+    return hasher.digest().hex()
+
+
+def legacy_highlight_patterns(patterns, text, html=True, highlight_color_replace="#FFFF00", highlight_color_match="#00FFFF"):
+    """Per-pattern highlight_patterns kept as the baseline for comparison."""
+    def add_highlight(match, color):
+        return f'<span style="background-color: {color};">{match.group(0)}</span>' if html else f'<typo>{match.group(0)}</typo>'
+
+    highlighted_text = text
+    for pattern, replacement in patterns:
+        matches = list(re.finditer(pattern, text))
+        replacement = replacement.lstrip('<IGNORE>').rstrip('</IGNORE>')
+        for match in matches:
+            if replacement in match.group(0):
+                highlighted_text = highlighted_text.replace(match.group(0), add_highlight(match, highlight_color_match))
+            else:
+                highlighted_text = highlighted_text.replace(match.group(0), add_highlight(match, highlight_color_replace))
+    return highlighted_text
+
+
+def timeit(func, *args, repeat=3, **kwargs) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_hash_dataframe(row_counts=(10_000, 100_000, 1_000_000)):
+    print(f"{'rows':>10} {'legacy (s)':>12} {'chunked (s)':>12} {'fast (s)':>10}")
+    for n_rows in row_counts:
+        df = make_corpus(n_rows, duplication=0.99, text_length=20)
+        legacy = timeit(legacy_hash_dataframe, df)
+        chunked = timeit(core.hash_dataframe, df)
+        fast = timeit(core.hash_dataframe, df, fast=True)
+        print(f'{n_rows:>10} {legacy:>12.4f} {chunked:>12.4f} {fast:>10.4f}')
+
+
+def bench_highlight_patterns(n_texts=5_000):
+    texts = make_corpus(n_texts).get_column('text').to_list()
+    print(f"{'patterns':>10} {'legacy (s)':>12} {'matcher (s)':>12}")
+    for name, patterns in core.get_available_patterns().items():
+        core.get_pattern_matcher(patterns)
+        legacy = timeit(lambda: [legacy_highlight_patterns(patterns, text) for text in texts], repeat=1)
+        matcher = timeit(lambda: [core.highlight_patterns(patterns, text) for text in texts], repeat=1)
+        print(f'{name:>10} {legacy:>12.4f} {matcher:>12.4f}')
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark suite and regression harness for the preprocessing pipeline.')
+    parser.add_argument('--rows', type=int, default=50_000)
+    parser.add_argument('--duplication', type=float, default=0.5, help='Share of duplicated rows (0-1)')
+    parser.add_argument('--text-length', type=int, default=80, help='Mean text length in characters')
+    parser.add_argument('--patterns', nargs='+', default=None, help='Pattern sets, default all')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='Write results JSON here (default stdout)')
+    parser.add_argument('--baseline', default=None, help='Previous results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Allowed rows/sec drop against the baseline before failing (fraction)')
+    parser.add_argument('--memory-threshold', type=float, default=0.3,
+                        help='Allowed peak memory growth against the baseline before failing (fraction)')
+    parser.add_argument('--micro', action='store_true', help='Run the legacy-vs-current micro-benchmarks')
+    args = parser.parse_args(argv)
+
+    if args.micro:
+        bench_hash_dataframe()
+        bench_highlight_patterns()
+        return 0
+
+    report = run_suite(args.rows, args.duplication, args.text_length, patterns=args.patterns,
+                       workers=args.workers, repeat=args.repeat, seed=args.seed)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            report['regressions'] = compare(report, json.load(baseline_file), threshold=args.threshold,
+                                            memory_threshold=args.memory_threshold)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+    for regression in report.get('regressions', []):
+        print(f"REGRESSION {regression['stage']}: {regression['change']:+.0%} {regression['metric']}", file=sys.stderr)
+    return 1 if report.get('regressions') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""Headless batch entry point for the preprocessing pipeline. Does not import Streamlit.
+
+Usage:
+    python cli.py input.csv output.parquet --columns comment title --patterns natural --workers 8
+"""
+import time
+
+START = time.perf_counter()
+
+import argparse
+import os
+import sys
+
+INPUT_TYPES = {
+    '.csv': 'text/csv',
+    '.parquet': 'parquet',
+    '.arrow': 'ipc',
+    '.feather': 'ipc',
+    '.ipc': 'ipc',
+    '.xlsx': 'excel',
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Thai text preprocessing for csv/xlsx/parquet/arrow files.')
+    parser.add_argument('input', help='Input file (.csv, .xlsx, .parquet, .arrow/.feather)')
+    parser.add_argument('output', help='Output file (.csv, .xlsx, .parquet, .arrow/.feather)')
+    parser.add_argument('--columns', nargs='+', required=True, help='Text columns to preprocess')
+    parser.add_argument('--suffix', default='_pre_text', help='Output column suffix')
+    parser.add_argument('--sheet', default=None, help='Sheet name for .xlsx input')
+    parser.add_argument('--keep-stopwords', action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument('--keep-format', action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument('--lower-case', action=argparse.BooleanOptionalAction, default=False)
+    parser.add_argument('--token-list', action=argparse.BooleanOptionalAction, default=False,
+                        help='Return token lists (kept as list columns in .parquet/.arrow)')
+    parser.add_argument('--include-pattern', default='/()', help='Special characters to keep')
+    parser.add_argument('--patterns', default='default', choices=('default', 'natural', 'corporate'))
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Process pool size')
+    parser.add_argument('--deduplicate', action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument('--disk-cache', action=argparse.BooleanOptionalAction, default=False)
+    parser.add_argument('--stream', action='store_true',
+                        help='Process a .csv input chunk by chunk into a .csv or .csv.gz output (bounded memory)')
+    parser.add_argument('--chunk-rows', type=int, default=None, help='Rows per chunk')
+    return parser.parse_args(argv)
+
+
+def log(message: str) -> None:
+    print(f'[{time.perf_counter() - START:8.2f}s] {message}', file=sys.stderr)
+
+
+def write_output(df, path: str) -> None:
+    import core
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        core.join_token_lists(df).write_csv(path)
+    elif extension == '.parquet':
+        df.write_parquet(path, compression='zstd')
+    elif extension in ('.arrow', '.feather', '.ipc'):
+        df.write_ipc(path)
+    elif extension == '.xlsx':
+        core.write_xlsx(df, path)
+    else:
+        raise ValueError(f'Unsupported output format: {extension}')
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    input_type = INPUT_TYPES.get(os.path.splitext(args.input)[1].lower())
+    if input_type is None:
+        raise SystemExit(f'Unsupported input format: {args.input}')
+
+    import core
+    log('core imported')
+
+    output_cols = [column + args.suffix for column in args.columns]
+    options = dict(keep_stopwords=args.keep_stopwords,
+                   keep_format=args.keep_format,
+                   return_token_list=args.token_list,
+                   lower_case=args.lower_case,
+                   include_pattern=args.include_pattern,
+                   patterns=args.patterns,
+                   deduplicate=args.deduplicate,
+                   use_disk_cache=args.disk_cache,
+                   workers=args.workers)
+
+    first_chunk = []
+    def on_progress(done, total):
+        if not first_chunk:
+            first_chunk.append(done)
+            log('first chunk processed')
+
+    if args.stream:
+        if input_type != 'text/csv' or not args.output.lower().endswith(('.csv', '.csv.gz')):
+            raise SystemExit('--stream needs .csv input and .csv or .csv.gz output')
+        stats = core.stream_preprocess_csv(args.input, args.output, args.columns, output_cols,
+                                           chunk_rows=args.chunk_rows or core.STREAM_CHUNK_ROWS,
+                                           progress_callback=on_progress,
+                                           **options)
+        log(f"{stats['rows']:,} rows in {stats['chunks']} chunks written to {args.output}")
+        return 0
+
+    df = core.load_file(args.input, input_type, selected_sheet=args.sheet)
+    log(f'{df.height:,} rows loaded')
+    df, dedup_stats = core.preprocess_columns(df, args.columns, output_cols,
+                                              chunk_rows=args.chunk_rows or core.PREPROCESS_CHUNK_ROWS,
+                                              progress_callback=on_progress,
+                                              **options)
+    for column, stats in dedup_stats.items():
+        log(f"{column}: {stats['unique_texts']:,} unique of {stats['non_null_rows']:,} texts, "
+            f"{stats['cache_hits']:,} from disk cache")
+    write_output(df, args.output)
+    log(f'{df.height:,} rows written to {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
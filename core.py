@@ -0,0 +1,1169 @@
+"""Streamlit-free core of the preprocessing pipeline, shared by the app (`utils`) and the CLI.
+
+Heavy dependencies (ThaiTextPrepKit, xlsxwriter) are imported on first use so that
+importing this module stays cheap.
+"""
+import gzip
+import hashlib
+import itertools
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+import zipfile
+from collections import Counter, OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from functools import lru_cache
+
+import mmh3
+import polars as pl
+
+from text_cache import TextCache
+
+@lru_cache(maxsize=None)
+def get_available_patterns() -> dict:
+    from ThaiTextPrepKit import typo_patterns as TYPO
+    return {
+        'default': TYPO.patterns,
+        'natural': TYPO.natural_patterns,
+        'corporate': TYPO.corp_patterns,
+    }
+
+def pattern_set_version(patterns: str) -> str:
+    """Fingerprint of a pattern set and the installed ThaiTextPrepKit version.
+    Changes whenever the library is upgraded or the TYPO list is edited.
+    """
+    import ThaiTextPrepKit
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(f'{ThaiTextPrepKit.__version__}\x1f{patterns}'.encode())
+    for pattern, replacement in get_available_patterns().get(patterns) or []:
+        hasher.update(f'\x1e{getattr(pattern, "pattern", pattern)}\x1f{replacement}'.encode())
+    return hasher.hexdigest()
+
+_text_cache = None
+_text_cache_lock = threading.Lock()
+
+def get_text_cache() -> TextCache:
+    """Process-wide on-disk cache of preprocessed texts. Stale pattern set versions are purged on open."""
+    global _text_cache
+    with _text_cache_lock:
+        if _text_cache is None:
+            _text_cache = TextCache()
+            _text_cache.purge_stale(pattern_set_version(name) for name in get_available_patterns())
+        return _text_cache
+
+HASH_CHUNK_ROWS = 1_000_000
+PREPROCESS_CHUNK_ROWS = 20_000
+STREAM_CHUNK_ROWS = 100_000
+STREAM_SAMPLE_ROWS = 1_000
+RATE_MIN_TEXTS = 1_000
+XLSX_MAX_ROWS = 1_048_576
+XLSX_CHUNK_ROWS = 50_000
+FAST_FINGERPRINT_ROWS = 100_000
+
+def hash_dataframe(df: pl.DataFrame, seed=42, chunk_rows=HASH_CHUNK_ROWS, fast=False) -> str:
+    """Hash a polars DataFrame. Due to the behaviour of pl.DataFrame.hash_rows 
+    this will only be consistent given a polars version.
+
+    The row hashes are fed to mmh3 as contiguous uint64 buffers, `chunk_rows` rows
+    at a time, after the shape, column names and dtypes.
+    Args:
+        df (pl.DataFrame): polars DataFrame to be hashed.
+        seed (int, optional): Seed for the hash function.
+        chunk_rows (int, optional): Number of rows hashed per chunk.
+        fast (bool, optional): Only hash an evenly spaced sample of about
+            FAST_FINGERPRINT_ROWS rows (plus the shape and schema) for huge frames.
+    Returns:
+        str: Hash of the polars DataFrame.
+    """
+    hasher = mmh3.mmh3_x64_128(seed=seed)
+    hasher.update(f'{df.height}x{df.width}'.encode())
+    for name, dtype in df.schema.items():
+        hasher.update(f'{name}\x1f{dtype}\x1e'.encode())
+
+    if df.width == 0 or df.height == 0:
+        return hasher.digest().hex()
+
+    if fast and df.height > FAST_FINGERPRINT_ROWS:
+        step = df.height // FAST_FINGERPRINT_ROWS
+        df = df.gather_every(step).vstack(df.tail(1))
+
+    for offset in range(0, df.height, chunk_rows):
+        row_hashes = df.slice(offset, chunk_rows).hash_rows(seed=seed)
+        hasher.update(row_hashes.to_numpy().tobytes())
+    return hasher.digest().hex()
+
+_XLSX_NS = {
+    'main': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main',
+    'rel': 'http://schemas.openxmlformats.org/package/2006/relationships',
+}
+_XLSX_REL_ID = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id'
+
+def _column_number(letters: str) -> int:
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - ord('A') + 1
+    return number
+
+def read_xlsx_metadata(file) -> list:
+    """List the sheets of an .xlsx file with approximate sizes, without loading any cells.
+
+    Sheet names come from xl/workbook.xml and sizes from the <dimension> element at the
+    start of each sheet's XML, so only the first few KB of every sheet are read.
+    Returns:
+        list[dict]: name, rows and columns (None when the workbook does not record a dimension).
+    """
+    sheets = []
+    with zipfile.ZipFile(file) as archive:
+        for name, path in _xlsx_sheet_paths(archive).items():
+            rows = columns = None
+            if path in archive.namelist():
+                with archive.open(path) as sheet_xml:
+                    dimension = re.search(rb'<dimension ref="[A-Z]+(\d+):([A-Z]+)(\d+)"', sheet_xml.read(4096))
+                if dimension:
+                    rows = int(dimension.group(3)) - int(dimension.group(1)) + 1
+                    columns = _column_number(dimension.group(2).decode())
+            sheets.append({'name': name, 'rows': rows, 'columns': columns})
+    return sheets
+
+def _xlsx_sheet_paths(archive: zipfile.ZipFile) -> dict:
+    """{sheet name: path of its XML in the archive}, in workbook order."""
+    workbook = ET.fromstring(archive.read('xl/workbook.xml'))
+    rels = ET.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    targets = {rel.get('Id'): rel.get('Target') for rel in rels.findall('rel:Relationship', _XLSX_NS)}
+    paths = {}
+    for sheet in workbook.findall('main:sheets/main:sheet', _XLSX_NS):
+        target = targets.get(sheet.get(_XLSX_REL_ID), '')
+        paths[sheet.get('name')] = target.lstrip('/') if target.startswith('/') else f'xl/{target}'
+    return paths
+
+def read_xlsx_header(file, sheet_name: str):
+    """Column names of a sheet from the first row of its XML, without parsing the rest of the sheet.
+
+    Returns None when the header is not plain, distinct, gap-free text (numbers, blanks,
+    duplicates), where calamine's own naming has to be used instead.
+    """
+    main = f'{{{_XLSX_NS["main"]}}}'
+    with zipfile.ZipFile(file) as archive:
+        path = _xlsx_sheet_paths(archive).get(sheet_name)
+        if path not in archive.namelist():
+            return None
+        cells = []
+        with archive.open(path) as sheet_xml:
+            for _, element in ET.iterparse(sheet_xml):
+                if element.tag == f'{main}row':
+                    cells = [(cell.get('r'), cell.get('t'), cell.findtext(f'{main}v'),
+                              ''.join(text.text or '' for text in cell.iter(f'{main}t')))
+                             for cell in element.findall(f'{main}c')]
+                    break
+        if not cells:
+            return None
+
+        shared = {int(value) for _, kind, value, _ in cells if kind == 's' and value is not None}
+        strings = {}
+        if shared and 'xl/sharedStrings.xml' in archive.namelist():
+            with archive.open('xl/sharedStrings.xml') as strings_xml:
+                index = 0
+                for _, element in ET.iterparse(strings_xml):
+                    if element.tag == f'{main}si':
+                        if index in shared:
+                            strings[index] = ''.join(text.text or '' for text in element.iter(f'{main}t'))
+                        index += 1
+                        element.clear()
+                        if index > max(shared):
+                            break
+
+    names, expected = [], None
+    for reference, kind, value, inline in cells:
+        column = _column_number(re.match(r'[A-Z]+', reference or '').group(0)) if reference else None
+        if kind == 's' and value is not None:
+            name = strings.get(int(value))
+        elif kind in ('inlineStr', 'str'):
+            name = inline if kind == 'inlineStr' else value
+        else:
+            return None
+        if not name or (expected is not None and column != expected):
+            return None
+        names.append(name)
+        expected = column + 1 if column is not None else None
+    return names if len(set(names)) == len(names) else None
+
+def load_file(source, file_type, selected_sheet=None, columns=None):
+    """Read an input file (path or file-like) according to `file_type`."""
+    if file_type == 'text/csv':
+        dataframe = pl.read_csv(source)
+        return dataframe
+
+    elif file_type == 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet':
+        sheets = read_xlsx_metadata(source)
+        return sheets
+
+    elif file_type == 'excel_columns':
+        header = read_xlsx_header(source, selected_sheet)
+        if header is not None:
+            return header
+        dataframe = pl.read_excel(source,
+                        sheet_name=selected_sheet,
+                        engine='calamine',
+                        read_options={'n_rows': 0})
+        return dataframe.columns
+    
+    elif file_type == 'csv_sample':
+        dataframe = pl.read_csv(source, n_rows=STREAM_SAMPLE_ROWS)
+        return dataframe
+
+    elif file_type == 'parquet':
+        dataframe = pl.read_parquet(source)
+        return dataframe
+
+    elif file_type == 'ipc':
+        dataframe = pl.read_ipc(source)
+        return dataframe
+
+    elif file_type == 'excel':
+        dataframe = pl.read_excel(source,
+                        sheet_name=selected_sheet,
+                        engine='calamine',
+                        columns=columns or None,
+                        infer_schema_length=None,
+                        # Rows blank in the selected columns are still rows of the sheet.
+                        drop_empty_rows=not columns)
+        return dataframe
+
+def _lookup_disk_cache(texts: pl.Series, patterns, options: dict):
+    """Split unique texts into ({text: cached result}, texts still to preprocess)."""
+    cached = get_text_cache().get_many(pattern_set_version(patterns),
+                                       TextCache.options_key(**options),
+                                       texts.to_list())
+    return cached, texts.filter(~texts.is_in(list(cached)))
+
+def _store_disk_cache(texts: pl.Series, results: pl.Series, patterns, options: dict) -> None:
+    get_text_cache().set_many(pattern_set_version(patterns),
+                              TextCache.options_key(**options),
+                              zip(texts.to_list(), results.to_list()))
+
+def _join_back(df, input_col, output_col, texts: pl.Series, results: pl.Series, cached: dict):
+    """Map preprocessed unique `texts` (and disk cache hits) back onto every row of `input_col`."""
+    mapped = pl.DataFrame([texts.alias(input_col), results.alias('__preprocessed__')])
+    if cached:
+        cached = pl.DataFrame({input_col: list(cached), '__preprocessed__': list(cached.values())})
+        mapped = pl.concat([mapped, cached], how='vertical_relaxed') if mapped.height else cached
+    return (df.select(input_col)
+              .join(mapped, on=input_col, how='left', maintain_order='left')
+              .get_column('__preprocessed__')
+              .alias(output_col))
+
+_per_text_seconds = {}
+
+def _per_text_cost(patterns, preprocess_seconds: float, processed_texts: int):
+    """Seconds per preprocessed text for `patterns`, from the time spent preprocessing only
+    (no cache lookups, joins or pool startup). Runs of at least RATE_MIN_TEXTS texts update
+    the rate kept for the pattern set; smaller runs use the kept rate when there is one,
+    else their own (None when nothing was preprocessed and no rate is kept)."""
+    if processed_texts >= RATE_MIN_TEXTS:
+        _per_text_seconds[patterns] = preprocess_seconds / processed_texts
+    rate = _per_text_seconds.get(patterns)
+    if rate is None and processed_texts:
+        rate = preprocess_seconds / processed_texts
+    return rate
+
+def _dedup_stats(series: pl.Series, unique_texts: int, cache_hits: int, per_text) -> dict:
+    non_null_rows = series.len() - series.null_count()
+    return {
+        'rows': series.len(),
+        'non_null_rows': non_null_rows,
+        'unique_texts': unique_texts,
+        'cache_hits': cache_hits,
+        'dedup_ratio': 1 - unique_texts / non_null_rows if non_null_rows else 0.0,
+        'time_saved': per_text * (non_null_rows - unique_texts + cache_hits) if per_text is not None else None,
+    }
+
+def _preprocess_chunk(series: pl.Series, patterns, options: dict) -> tuple:
+    """Worker task of `preprocess_columns`. Looks the pattern set up by name so only the chunk is pickled.
+    Returns (results, seconds spent preprocessing the chunk).
+    """
+    from ThaiTextPrepKit.polars_pretextkit import preprocess_text_batches
+    start = time.perf_counter()
+    results = preprocess_text_batches(series=series,
+                                      patterns=get_available_patterns().get(patterns),
+                                      **options)
+    return results, time.perf_counter() - start
+
+class PreprocessCancelled(Exception):
+    """Raised by `preprocess_columns` when its `cancel_event` is set."""
+
+def process_pool(max_workers: int=None) -> ProcessPoolExecutor:
+    """Process pool whose workers are spawned, not forked: forking a multi-threaded process
+    (the Streamlit server, Polars' thread pool) can deadlock the child."""
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+
+def _run_chunks(executor, tasks: list, patterns, options: dict, max_in_flight: int,
+                progress_callback=None, cancel_event=None) -> dict:
+    """Run (i, offset, chunk) tasks on `executor` with at most `max_in_flight` chunks submitted
+    at a time, so jobs sharing one pool interleave. Returns {(i, offset): (result, seconds)}.
+    """
+    results, pending = {}, {}
+    remaining = iter(tasks)
+    try:
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                raise PreprocessCancelled()
+            for i, offset, chunk in itertools.islice(remaining, max(max_in_flight - len(pending), 0)):
+                pending[executor.submit(_preprocess_chunk, chunk, patterns, options)] = (i, offset)
+            if not pending:
+                return results
+            finished, _ = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in finished:
+                results[pending.pop(future)] = future.result()
+                if progress_callback is not None:
+                    progress_callback(len(results), len(tasks))
+    finally:
+        for future in pending:
+            future.cancel()
+
+def preprocess_columns(df,
+                       input_cols: list,
+                       output_cols: list,
+                       keep_stopwords: bool=True,
+                       keep_format: bool=True,
+                       return_token_list: bool=False,
+                       patterns=None,
+                       deduplicate: bool=True,
+                       use_disk_cache: bool=False,
+                       workers: int=None,
+                       chunk_rows: int=PREPROCESS_CHUNK_ROWS,
+                       progress_callback=None,
+                       executor=None,
+                       cancel_event=None,
+                       **kwargs):
+    """Preprocess several text columns at once, fanning (column, row chunk) tasks out to a process pool.
+    All output columns are added to `df` with a single hstack.
+
+    Args:
+        input_cols (list): Text columns to preprocess.
+        output_cols (list): Output column names, one per input column.
+        deduplicate (bool, optional): Only preprocess the unique non-null texts of each column.
+        use_disk_cache (bool, optional): Reuse results from the on-disk TextCache (requires deduplicate).
+        workers (int, optional): Process pool size, defaults to the number of CPUs. 1 runs in-process.
+            With `executor`, the number of chunks kept in flight on it.
+        chunk_rows (int, optional): Number of texts per task.
+        progress_callback (callable, optional): Called as (done_chunks, total_chunks) after each chunk.
+        executor (Executor, optional): Shared process pool to run the chunks on instead of a new one.
+        cancel_event (threading.Event, optional): Once set, pending chunks are dropped and
+            `PreprocessCancelled` is raised.
+    Returns:
+        tuple[pl.DataFrame, dict]: Preprocessed DataFrame and dedup stats per input column
+            (rows, non_null_rows, unique_texts, cache_hits, dedup_ratio, elapsed, time_saved).
+            time_saved is None when every text came from the disk cache and no rate was measured yet.
+    """
+    start = time.perf_counter()
+    options = dict(keep_stopwords=keep_stopwords,
+                   keep_format=keep_format,
+                   return_token_list=return_token_list,
+                   **kwargs)
+
+    columns = []
+    for input_col in input_cols:
+        series = df.get_column(input_col)
+        texts = series.drop_nulls().unique(maintain_order=True) if deduplicate else series
+        cached = {}
+        if deduplicate and use_disk_cache and series.dtype == pl.String:
+            cached, texts = _lookup_disk_cache(texts, patterns, options)
+        columns.append((series, texts, cached))
+
+    tasks = [(i, offset, texts.slice(offset, chunk_rows))
+             for i, (_, texts, _) in enumerate(columns)
+             for offset in range(0, texts.len(), chunk_rows)]
+    results = {}
+    if executor is not None:
+        results = _run_chunks(executor, tasks, patterns, options, workers or os.cpu_count() or 1,
+                              progress_callback=progress_callback, cancel_event=cancel_event)
+    elif workers == 1 or len(tasks) <= 1:
+        for done, (i, offset, chunk) in enumerate(tasks, start=1):
+            if cancel_event is not None and cancel_event.is_set():
+                raise PreprocessCancelled()
+            results[i, offset] = _preprocess_chunk(chunk, patterns, options)
+            if progress_callback is not None:
+                progress_callback(done, len(tasks))
+    else:
+        with process_pool(workers) as executor:
+            results = _run_chunks(executor, tasks, patterns, options, len(tasks),
+                                  progress_callback=progress_callback, cancel_event=cancel_event)
+
+    outputs = []
+    processed_texts = 0
+    preprocess_seconds = sum(seconds for _, seconds in results.values())
+    for i, (series, texts, cached) in enumerate(columns):
+        chunks = [results[i, offset][0] for offset in range(0, texts.len(), chunk_rows)]
+        column_results = pl.concat(chunks) if chunks else pl.Series([], dtype=pl.Null)
+        processed_texts += texts.len()
+        if not deduplicate:
+            outputs.append(column_results.alias(output_cols[i]))
+            continue
+        if use_disk_cache and series.dtype == pl.String and texts.len():
+            _store_disk_cache(texts, column_results, patterns, options)
+        outputs.append(_join_back(df, input_cols[i], output_cols[i], texts, column_results, cached))
+
+    df = df.drop([col for col in output_cols if col in df.columns]).hstack(outputs)
+    elapsed = time.perf_counter() - start
+
+    per_text = _per_text_cost(patterns, preprocess_seconds, processed_texts)
+    stats = {}
+    for input_col, (series, texts, cached) in zip(input_cols, columns):
+        if deduplicate:
+            stats[input_col] = _dedup_stats(series, texts.len() + len(cached), len(cached), per_text)
+            stats[input_col]['elapsed'] = elapsed
+    return df, stats
+
+def _child_pids(pid: int) -> list:
+    """Every descendant of `pid`, e.g. process pool workers, read from /proc/<pid>/stat."""
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as stat:
+                    parents.setdefault(int(stat.read().rsplit(')', 1)[1].split()[1]), []).append(int(entry))
+            except (OSError, IndexError, ValueError):
+                continue
+    children, pending = [], [pid]
+    while pending:
+        found = parents.get(pending.pop(), [])
+        children += found
+        pending += found
+    return children
+
+def process_memory(include_children: bool=False):
+    """Resident memory of this process in bytes, or None where /proc is not available.
+    With `include_children`, the resident memory of its descendants (pool workers) is added.
+    """
+    pids = ['self'] + (_child_pids(os.getpid()) if include_children else [])
+    total = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/statm') as statm:
+                total += int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except OSError:
+            if pid == 'self':
+                return None
+    return total
+
+RESULT_OPTIONS = {
+    'keep_stopwords': True,
+    'keep_format': True,
+    'return_token_list': False,
+    'lower_case': False,
+    'include_pattern': None,
+    'patterns': None,
+}
+
+RESULT_STORE_MAX_BYTES = int(os.environ.get('RESULT_STORE_MAX_BYTES', 1024 ** 3))
+
+class ResultStore:
+    """Preprocessed output columns of one source frame, keyed by (input column, options).
+
+    Only the output Series are kept, never copies of the frame, so a re-run computes just
+    the missing (column, options) pairs and result frames are assembled with one hstack.
+    Options that do not change the output (deduplicate, workers, ...) are not part of the key.
+    Results beyond `max_bytes` are evicted least recently used first, except the pairs
+    `pinned` by a run in progress, so one run never evicts its own outputs.
+    Args:
+        fingerprint (str): `hash_dataframe` of the source frame the results belong to.
+        max_bytes (int, optional): Budget for the stored output columns.
+    """
+    def __init__(self, fingerprint: str, max_bytes: int=RESULT_STORE_MAX_BYTES):
+        self.fingerprint = fingerprint
+        self.max_bytes = max_bytes
+        self._results = OrderedDict()
+        self._stats = {}
+        self._pins = Counter()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(column: str, options: dict) -> tuple:
+        return (column, tuple((name, options.get(name, default)) for name, default in RESULT_OPTIONS.items()))
+
+    def __contains__(self, item) -> bool:
+        column, options = item
+        return self.key(column, options) in self._results
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def missing(self, columns: list, options: dict) -> list:
+        return [column for column in columns if (column, options) not in self]
+
+    def add(self, column: str, options: dict, series: pl.Series, stats: dict=None) -> None:
+        key = self.key(column, options)
+        with self._lock:
+            self._results[key] = series
+            self._results.move_to_end(key)
+            if stats is not None:
+                self._stats[key] = stats
+            self._evict(keep=key)
+
+    @contextmanager
+    def pinned(self, pairs):
+        """Keep the (column, options) `pairs` from being evicted while the block runs."""
+        keys = [self.key(column, options) for column, options in pairs]
+        with self._lock:
+            self._pins.update(keys)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pins.subtract(keys)
+                self._pins += Counter()
+
+    def _evict(self, keep) -> None:
+        size = self.nbytes()
+        for key in list(self._results):
+            if size <= self.max_bytes:
+                break
+            if key != keep and not self._pins[key]:
+                size -= self._results.pop(key).estimated_size()
+                self._stats.pop(key, None)
+
+    def get(self, column: str, options: dict):
+        key = self.key(column, options)
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+            return self._results.get(key)
+
+    def stats(self, column: str, options: dict):
+        return self._stats.get(self.key(column, options))
+
+    def frame(self, base: pl.DataFrame, outputs: list):
+        """`base` with the stored results added as columns, from (input column, options, output name)
+        triples, or None while any of them is missing.
+        """
+        results = [self.get(column, options) for column, options, _ in outputs]
+        if any(result is None for result in results):
+            return None
+        names = [output for _, _, output in outputs]
+        return (base.drop([name for name in names if name in base.columns])
+                    .hstack([result.alias(output) for result, output in zip(results, names)]))
+
+    def frame_fingerprint(self, outputs: list) -> str:
+        """Fingerprint of `frame(base, outputs)` derived from the keys, without hashing the rows again."""
+        hasher = hashlib.blake2b(digest_size=16)
+        hasher.update(self.fingerprint.encode())
+        for column, options, output in outputs:
+            hasher.update(f'\x1e{self.key(column, options)!r}\x1f{output}'.encode())
+        return hasher.hexdigest()
+
+    def nbytes(self) -> int:
+        return sum(series.estimated_size() for series in list(self._results.values()))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._results.clear()
+            self._stats.clear()
+
+def preprocess_missing(df: pl.DataFrame,
+                       input_cols: list,
+                       option_sets: list,
+                       store: ResultStore,
+                       progress_callback=None,
+                       **kwargs) -> dict:
+    """Preprocess only the (column, options) pairs of `input_cols` x `option_sets` missing from `store`
+    and add them to it. Only the missing input columns are selected from `df`.
+
+    Args:
+        option_sets (list): Dicts of RESULT_OPTIONS.
+        progress_callback (callable, optional): Called as (done, total) across all option sets.
+        **kwargs: Forwarded to `preprocess_columns` (deduplicate, workers, executor, ...).
+    Returns:
+        dict: Number of (column, options) pairs computed and reused.
+    """
+    todo = [(options, store.missing(input_cols, options)) for options in option_sets]
+    todo = [(options, columns) for options, columns in todo if columns]
+    with store.pinned([(column, options) for options in option_sets for column in input_cols]):
+        for k, (options, columns) in enumerate(todo):
+            def on_progress(done, total, k=k):
+                if progress_callback is not None:
+                    progress_callback(k + done / total, len(todo))
+
+            output_cols = [f'__preprocessed_{i}__' for i in range(len(columns))]
+            result, stats = preprocess_columns(df.select(columns), columns, output_cols,
+                                               progress_callback=on_progress, **options, **kwargs)
+            for column, output_col in zip(columns, output_cols):
+                store.add(column, options, result.get_column(output_col), stats.get(column))
+
+    computed = sum(len(columns) for _, columns in todo)
+    return {'computed': computed, 'reused': len(input_cols) * len(option_sets) - computed}
+
+def spool_upload(uploaded_file, suffix='.csv') -> str:
+    """Copy an uploaded file to a named temp file in fixed-size blocks and return its path."""
+    uploaded_file.seek(0)
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as spool:
+        shutil.copyfileobj(uploaded_file, spool, length=16 * 1024 ** 2)
+    return spool.name
+
+def join_token_lists(df: pl.DataFrame) -> pl.DataFrame:
+    """Space-join every token list column, for formats without nested types (CSV, xlsx, HTML)."""
+    return df.with_columns(pl.col(column).list.join(' ') for column, dtype in df.schema.items()
+                           if isinstance(dtype, pl.List))
+
+def stream_preprocess_csv(source: str,
+                          output_path: str,
+                          input_cols: list,
+                          output_cols: list,
+                          chunk_rows: int=STREAM_CHUNK_ROWS,
+                          progress_callback=None,
+                          remove_source: bool=False,
+                          **kwargs) -> dict:
+    """Preprocess a CSV file that may not fit in memory, `chunk_rows` rows at a time.
+
+    Batches are read lazily from `source`, passed through `preprocess_columns` and
+    appended to the CSV at `output_path`. Without an `executor` in `kwargs`, one process
+    pool is created for the whole file and shared by every batch.
+    Args:
+        source (str): Input CSV path.
+        output_path (str): Output CSV path, overwritten. Gzip-compressed when it ends in `.gz`.
+        input_cols (list): Text columns to preprocess.
+        output_cols (list): Output column names, one per input column.
+        chunk_rows (int, optional): Rows per batch, bounds the peak memory.
+        progress_callback (callable, optional): Called as (done_rows, total_rows) after each batch.
+        remove_source (bool, optional): Delete `source` when done, e.g. a spooled upload.
+        **kwargs: Options forwarded to `preprocess_columns`.
+    Returns:
+        dict: rows, chunks, elapsed seconds and `head`, the first rows of the output.
+    """
+    start = time.perf_counter()
+    rows = chunks = 0
+    head = None
+    executor = None
+    if kwargs.get('executor') is None and kwargs.get('workers') != 1:
+        executor = kwargs['executor'] = process_pool(kwargs.get('workers'))
+    try:
+        scan = pl.scan_csv(source, schema_overrides={col: pl.String for col in input_cols})
+        total_rows = scan.select(pl.len()).collect().item()
+        if output_path.endswith('.gz'):
+            output_file = gzip.open(output_path, 'wb', compresslevel=6)
+        else:
+            output_file = open(output_path, 'wb')
+        with output_file as output:
+            for batch in scan.collect_batches(chunk_size=chunk_rows):
+                batch, _ = preprocess_columns(batch, input_cols, output_cols, **kwargs)
+                batch = join_token_lists(batch)
+                batch.write_csv(output, include_header=chunks == 0)
+                if head is None:
+                    head = batch.head(5)
+                rows += batch.height
+                chunks += 1
+                if progress_callback is not None:
+                    progress_callback(rows, total_rows)
+    except BaseException:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        if remove_source and os.path.exists(source):
+            os.remove(source)
+
+    return {'rows': rows, 'chunks': chunks, 'elapsed': time.perf_counter() - start, 'head': head}
+
+class InteractiveEngine:
+    """Warm, memoized single-text preprocessing for the "Test Here" tab.
+
+    Pattern sets, their PatternMatchers and the tokenizer are loaded once when the engine
+    is created, and results are kept in a bounded LRU keyed by (text, options).
+    Args:
+        max_entries (int, optional): Results kept in the LRU.
+    """
+    def __init__(self, max_entries: int=1024):
+        from ThaiTextPrepKit.polars_pretextkit import preprocess_text_batches
+        self._preprocess_text_batches = preprocess_text_batches
+        self.max_entries = max_entries
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self.patterns = get_available_patterns()
+        for name, patterns in self.patterns.items():
+            get_pattern_matcher(patterns)
+            self.process('สวัสดี', patterns=name)
+
+    @staticmethod
+    def _key(text, keep_stopwords=True, keep_format=True, return_token_list=False, lower_case=False,
+             include_pattern=None, patterns=None) -> tuple:
+        return (text, keep_stopwords, keep_format, return_token_list, lower_case, include_pattern, patterns)
+
+    def is_cached(self, text: str, **options) -> bool:
+        """Whether `process(text, **options)` would be served from the LRU."""
+        with self._lock:
+            return self._key(text, **options) in self._results
+
+    def process(self, text: str, keep_stopwords: bool=True, keep_format: bool=True, return_token_list: bool=False,
+                lower_case: bool=False, include_pattern: str=None, patterns=None):
+        """Preprocess one text with the options of `preprocess_columns`, returns the value instead of a Series."""
+        key = self._key(text, keep_stopwords, keep_format, return_token_list, lower_case, include_pattern, patterns)
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return self._results[key]
+        result = self._preprocess_text_batches(series=pl.Series([text]),
+                                               keep_stopwords=keep_stopwords,
+                                               keep_format=keep_format,
+                                               return_token_list=return_token_list,
+                                               lower_case=lower_case,
+                                               include_pattern=include_pattern,
+                                               patterns=self.patterns.get(patterns))[0]
+        if isinstance(result, pl.Series):
+            result = result.to_list()
+        with self._lock:
+            self._results[key] = result
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+        return result
+
+    def explain(self, text: str, patterns=None, **options) -> dict:
+        """Step-by-step breakdown of one text with the time of each step in ms.
+
+        Returns:
+            dict: output, typo_fixes (matched text, pattern, replacement), tokens,
+                stopwords_removed and timings.
+        """
+        timings = {}
+
+        start = time.perf_counter()
+        matcher = get_pattern_matcher(self.patterns.get(patterns) or [])
+        typo_fixes = []
+        for hit_start, hit_end, i in matcher.find(text):
+            matched = text[hit_start:hit_end]
+            match = matcher.patterns[i].fullmatch(matched)
+            try:
+                replacement = match.expand(matcher.replacements[i]) if match else matcher.replacements[i]
+            except (re.error, IndexError):
+                replacement = matcher.replacements[i]
+            typo_fixes.append({'text': matched, 'pattern': matcher.patterns[i].pattern, 'replacement': replacement})
+        timings['typo_fixes'] = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        output = self.process(text, patterns=patterns, **options)
+        timings['output'] = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        token_options = dict(options, return_token_list=True, keep_stopwords=True)
+        tokens = self.process(text, patterns=patterns, **token_options) or []
+        timings['tokens'] = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        kept = Counter(self.process(text, patterns=patterns, **dict(token_options, keep_stopwords=False)) or [])
+        stopwords_removed = []
+        for token in tokens:
+            if kept[token]:
+                kept[token] -= 1
+            else:
+                stopwords_removed.append(token)
+        timings['stopwords'] = (time.perf_counter() - start) * 1000
+
+        return {
+            'output': output,
+            'typo_fixes': typo_fixes,
+            'tokens': list(tokens),
+            'stopwords_removed': stopwords_removed,
+            'timings': timings,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._results.clear()
+
+def write_xlsx(df: pl.DataFrame, output, columns=None, chunk_rows=XLSX_CHUNK_ROWS, progress_callback=None) -> None:
+    """Write a polars DataFrame straight to an .xlsx file with xlsxwriter's constant memory mode.
+
+    Rows are written in order, `chunk_rows` at a time, without a pandas copy. Frames longer than
+    Excel's row limit spill onto Sheet2, Sheet3, ... each with its own header row.
+    Args:
+        df (pl.DataFrame): DataFrame to write.
+        output: File path or binary file-like object.
+        columns (list, optional): Only write these columns.
+        chunk_rows (int, optional): Rows materialized per chunk.
+        progress_callback (callable, optional): Called with the fraction of rows written.
+    """
+    if columns:
+        df = df.select(columns)
+    df = join_token_lists(df)
+    # xlsxwriter rejects NaN/inf; they are written as blank cells, as the pandas export did.
+    df = df.with_columns(pl.when(pl.col(column).is_finite()).then(pl.col(column)).alias(column)
+                         for column, dtype in df.schema.items() if dtype.is_float())
+
+    import xlsxwriter
+    sheet_rows = XLSX_MAX_ROWS - 1
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True, 'strings_to_urls': False, 'remove_timezone': True})
+    # Temporal cells need a number format, otherwise Excel shows them as serial numbers.
+    temporal_formats = {pl.Date: 'yyyy-mm-dd', pl.Datetime: 'yyyy-mm-dd hh:mm:ss', pl.Time: 'hh:mm:ss'}
+    temporal = [(index, workbook.add_format({'num_format': temporal_formats[dtype.base_type()]}))
+                for index, dtype in enumerate(df.dtypes) if dtype.base_type() in temporal_formats]
+    for sheet, sheet_offset in enumerate(range(0, max(df.height, 1), sheet_rows), start=1):
+        worksheet = workbook.add_worksheet(f'Sheet{sheet}')
+        worksheet.write_row(0, 0, df.columns)
+        sheet_df = df.slice(sheet_offset, sheet_rows)
+        for offset in range(0, sheet_df.height, chunk_rows):
+            for row, values in enumerate(sheet_df.slice(offset, chunk_rows).iter_rows(), start=offset + 1):
+                worksheet.write_row(row, 0, values)
+                for index, cell_format in temporal:
+                    if values[index] is not None:
+                        worksheet.write_datetime(row, index, values[index], cell_format)
+            if progress_callback is not None:
+                progress_callback((sheet_offset + min(offset + chunk_rows, sheet_df.height)) / df.height)
+    workbook.close()
+
+##################################
+##### FOR HTML COMPARE TABLE #####
+##################################
+_REGEX_METACHARS = set('.^$*+?{}[]\\|()')
+
+def _literal_prefix(pattern: re.Pattern) -> str:
+    """Literal text every match of `pattern` must start with, or '' if it cannot be determined."""
+    if pattern.flags & (re.IGNORECASE | re.VERBOSE) or '|' in pattern.pattern:
+        return ''
+    prefix = []
+    for char in pattern.pattern:
+        if char in _REGEX_METACHARS:
+            if char in '*?{' and prefix:
+                prefix.pop()
+            break
+        prefix.append(char)
+    return ''.join(prefix)
+
+class PatternMatcher:
+    """Finds the hits of a whole (pattern, replacement) list in a single scan per string.
+
+    Patterns are combined into one alternation of named groups, so at each position the
+    first pattern in list order wins and hits never overlap. Patterns that cannot be
+    combined (flags or backreferences) are searched separately, together with the
+    alternation, from a cursor after the last hit, so the same rule holds across both:
+    leftmost first, then list order. Texts that contain none of the patterns' literal
+    prefixes are skipped without running any regex.
+    """
+    def __init__(self, patterns):
+        self.patterns = []
+        self.replacements = []
+        combined, self.separate = [], []
+        for i, (pattern, replacement) in enumerate(patterns):
+            pattern = re.compile(pattern) if isinstance(pattern, str) else pattern
+            replacement = replacement.removeprefix('<IGNORE>').removesuffix('</IGNORE>')
+            self.patterns.append(pattern)
+            self.replacements.append(replacement)
+            if pattern.flags & ~re.UNICODE or re.search(r'\\\d|\(\?P=', pattern.pattern):
+                self.separate.append(i)
+            else:
+                combined.append(f'(?P<_p{i}>{pattern.pattern})')
+        try:
+            self.combined = re.compile('|'.join(combined)) if combined else None
+        except re.error:
+            self.combined = None
+            self.separate = list(range(len(self.patterns)))
+        prefixes = [_literal_prefix(pattern) for pattern in self.patterns]
+        self.prefixes = prefixes if all(prefixes) else None
+
+    def find(self, text: str) -> list:
+        """Return non-overlapping (start, end, pattern index) hits sorted by position."""
+        if self.prefixes is not None and not any(prefix in text for prefix in self.prefixes):
+            return []
+        if not self.separate:
+            return [(match.start(), match.end(), int(match.lastgroup[2:]))
+                    for match in self.combined.finditer(text) if match.end() > match.start()]
+        scanners = [(self.patterns[i], i) for i in self.separate]
+        if self.combined is not None:
+            scanners.insert(0, (self.combined, None))
+        upcoming = [_search_hit(pattern, index, text, 0) for pattern, index in scanners]
+        resolved = []
+        while any(upcoming):
+            hit = min(filter(None, upcoming), key=lambda hit: (hit[0], hit[2]))
+            resolved.append(hit)
+            # A scanner's next hit stays valid unless it starts inside the hit just taken.
+            upcoming = [next_hit if next_hit is None or next_hit[0] >= hit[1] else _search_hit(pattern, index, text, hit[1])
+                        for next_hit, (pattern, index) in zip(upcoming, scanners)]
+        return resolved
+
+def _search_hit(pattern, index, text: str, position: int):
+    """First non-empty (start, end, pattern index) hit of `pattern` at or after `position`.
+    `index` None reads the index from the named group of the combined alternation.
+    """
+    match = pattern.search(text, position)
+    while match is not None and match.end() == match.start():
+        if match.start() >= len(text):
+            return None
+        match = pattern.search(text, match.start() + 1)
+    if match is None:
+        return None
+    return match.start(), match.end(), int(match.lastgroup[2:]) if index is None else index
+
+_pattern_matchers = {}
+
+def get_pattern_matcher(patterns) -> PatternMatcher:
+    """Compiled PatternMatcher for a pattern list, built once per list object."""
+    cached = _pattern_matchers.get(id(patterns))
+    if cached is None or cached[0] is not patterns:
+        cached = _pattern_matchers[id(patterns)] = (patterns, PatternMatcher(patterns))
+    return cached[1]
+
+def highlight_patterns(patterns, text, html=True, highlight_color_replace="#FFFF00", highlight_color_match="#00FFFF"):
+    """
+    Highlights all occurrences of the given regex patterns in the text using HTML <span> tags with background color.
+    Hits are found in one pass by `PatternMatcher`; overlapping hits keep the leftmost, then first pattern in list order.
+
+    :param patterns: A list of tuples containing regex patterns and their replacements.
+    :param text: The text to search within.
+    :param highlight_color_replace: The background color to use for replacements (default is yellow).
+    :param highlight_color_match: The background color to use for matches without replacement (default is blue).
+    :return: The text with highlighted matches.
+    """
+    matcher = get_pattern_matcher(patterns)
+    parts, position = [], 0
+    for start, end, i in matcher.find(text):
+        matched = text[start:end]
+        if html:
+            color = highlight_color_match if matcher.replacements[i] in matched else highlight_color_replace
+            highlighted = f'<span style="background-color: {color};">{matched}</span>'
+        else:
+            highlighted = f'<typo>{matched}</typo>'
+        parts.append(text[position:start])
+        parts.append(highlighted)
+        position = end
+    parts.append(text[position:])
+    return ''.join(parts)
+
+HTML_CHUNK_ROWS = 1_000
+
+HTML_PAGINATION_SCRIPT = """
+<div>
+<button onclick="showPage(currentPage - 1)">&lt; Prev</button>
+<span id="page-label"></span>
+<button onclick="showPage(currentPage + 1)">Next &gt;</button>
+</div>
+<script>
+var pages = document.querySelectorAll('tbody[data-page]');
+var currentPage = 0;
+function showPage(page) {
+    if (page < 0 || page >= pages.length) return;
+    pages.forEach(function (tbody, i) { tbody.style.display = i === page ? '' : 'none'; });
+    currentPage = page;
+    document.getElementById('page-label').textContent = 'Page ' + (page + 1) + ' / ' + pages.length;
+}
+showPage(0);
+</script>
+"""
+
+def iter_html_table(headers, rows, page_rows=None):
+    """
+    Yield an HTML table piece by piece so large tables never exist as one string.
+
+    Args:
+    - headers (list): Column names.
+    - rows (iterable): Iterable of row cell lists.
+    - page_rows (int, optional): Group rows into <tbody data-page> blocks of this size with
+      prev/next buttons showing one page at a time (client-side pagination).
+
+    Yields:
+    - str: HTML fragments.
+    """
+    yield "<table border='1'>\n"
+    yield "<tr>" + "".join(f"<th>{header}</th>" for header in headers) + "</tr>\n"
+    paged = False
+    for i, row in enumerate(rows):
+        if page_rows and i % page_rows == 0:
+            yield ("</tbody>\n" if paged else "") + f"<tbody data-page='{i // page_rows}'>\n"
+            paged = True
+        yield "<tr>" + "".join(f"<td>{cell}</td>" for cell in row) + "</tr>\n"
+    if paged:
+        yield "</tbody>\n"
+    yield "</table>"
+    if page_rows:
+        yield HTML_PAGINATION_SCRIPT
+
+def write_html_table(output, headers, rows, page_rows=None, chunk_rows=HTML_CHUNK_ROWS) -> None:
+    """Write `iter_html_table` to a binary file-like `output`, flushing every `chunk_rows` fragments."""
+    buffer = []
+    for fragment in iter_html_table(headers, rows, page_rows=page_rows):
+        buffer.append(fragment)
+        if len(buffer) >= chunk_rows:
+            output.write("".join(buffer).encode('utf-8'))
+            buffer.clear()
+    output.write("".join(buffer).encode('utf-8'))
+
+def get_highlight_texts(patterns, texts: list) -> list:
+    html_text = []
+    for text in texts:
+        html_text.append(highlight_patterns(patterns, text) if text is not None else "")
+    return html_text
+
+def _highlight_rows(df, patterns, columns, chunk_rows=HTML_CHUNK_ROWS):
+    """Yield highlighted rows of `columns`, highlighting `chunk_rows` rows at a time."""
+    for offset in range(0, df.height, chunk_rows):
+        chunk = df.slice(offset, chunk_rows)
+        yield from zip(*(get_highlight_texts(patterns, chunk.get_column(column).to_list())
+                         for column in columns))
+
+def to_html_highlight_table(df, patterns, raw_column, preprocess_column, page_rows=None, split_pages=False) -> bytes:
+    """Highlighted raw vs preprocessed HTML compare table.
+
+    Args:
+        raw_column (str | list): Raw text column(s).
+        preprocess_column (str | list): Preprocessed column(s), paired with `raw_column` in order.
+        page_rows (int, optional): Rows per page. Pages are shown one at a time in a single file
+            unless `split_pages` is set.
+        split_pages (bool, optional): Write each page to its own HTML file inside a zip archive.
+    Returns:
+        bytes: HTML file, or zip archive of HTML pages when `split_pages`.
+    """
+    patterns = get_available_patterns().get(patterns)
+    raw_columns = [raw_column] if isinstance(raw_column, str) else list(raw_column)
+    preprocess_columns = [preprocess_column] if isinstance(preprocess_column, str) else list(preprocess_column)
+
+    columns, headers = [], []
+    for raw, processed in zip(raw_columns, preprocess_columns):
+        columns += [raw, processed]
+        headers += ['Raw Text', 'PAREPA'] if len(raw_columns) == 1 else [f'{raw} (Raw Text)', f'{processed} (PAREPA)']
+
+    df = join_token_lists(df.select(columns)
+                            .filter(~pl.all_horizontal(pl.col(raw_columns).is_null())))
+
+    with tempfile.SpooledTemporaryFile(max_size=64 * 1024 ** 2) as output:
+        if split_pages and page_rows:
+            with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+                for page, offset in enumerate(range(0, max(df.height, 1), page_rows), start=1):
+                    with archive.open(f'HTML_compare_table_{page:04d}.html', 'w') as page_file:
+                        write_html_table(page_file, headers,
+                                         _highlight_rows(df.slice(offset, page_rows), patterns, columns))
+        else:
+            write_html_table(output, headers, _highlight_rows(df, patterns, columns), page_rows=page_rows)
+        output.seek(0)
+        return output.read()
+
+def get_patterns_table(patterns):
+    patterns = get_available_patterns().get(patterns)
+    replacements = []
+    #regex_patterns = []
+    for pattern, replacement in patterns:
+        #regex_patterns.append(pattern.pattern)
+        replacements.append(replacement if replacement != '' else None)
+    data_dict = {
+        #'regex': regex_patterns,
+        'replacement': replacements
+    }
+    return pl.DataFrame(data_dict).drop_nulls(['replacement'])
+#############################
+##### PATTERN PROFILING #####
+#############################
+PROFILE_SAMPLE_ROWS = 2_000
+SLOW_MATCH_MS = 5.0
+
+# A group that contains a quantifier and is itself quantified, e.g. (a+)+ or (.*)*
+_NESTED_QUANTIFIER = re.compile(r'\((?:[^()\\]|\\.)*[+*](?:[^()\\]|\\.)*\)(?:[+*]|\{\d*,\d*\})')
+
+def sample_texts(df: pl.DataFrame, columns: list, n: int=PROFILE_SAMPLE_ROWS, seed: int=0) -> list:
+    """Random sample of the non-null texts of `columns`, used as a profiling corpus."""
+    texts = pl.concat([df.get_column(column).cast(pl.String).drop_nulls() for column in columns])
+    return texts.sample(min(n, texts.len()), seed=seed).to_list() if texts.len() else []
+
+def profile_patterns(patterns, texts: list, slow_match_ms: float=SLOW_MATCH_MS) -> pl.DataFrame:
+    """Time every (pattern, replacement) of a pattern set over a corpus sample.
+
+    Each pattern is run with finditer over every text on its own. Patterns are flagged as
+    catastrophic-backtracking suspects when a single text takes longer than `slow_match_ms`
+    or when the regex nests quantifiers.
+    Returns:
+        pl.DataFrame: One row per pattern sorted by total time, with hits, total_ms,
+            mean_us (per text), max_ms (slowest text) and suspect (reason or null).
+    """
+    patterns = get_available_patterns().get(patterns)
+    rows = []
+    for index, (pattern, replacement) in enumerate(patterns):
+        pattern = re.compile(pattern) if isinstance(pattern, str) else pattern
+        hits, total, slowest = 0, 0.0, 0.0
+        for text in texts:
+            start = time.perf_counter()
+            hits += sum(1 for _ in pattern.finditer(text))
+            elapsed = time.perf_counter() - start
+            total += elapsed
+            slowest = max(slowest, elapsed)
+        suspect = None
+        if slowest * 1000 > slow_match_ms:
+            suspect = f'slow text ({slowest * 1000:.1f} ms)'
+        elif _NESTED_QUANTIFIER.search(pattern.pattern):
+            suspect = 'nested quantifier'
+        rows.append({
+            'index': index,
+            'regex': pattern.pattern,
+            'replacement': replacement,
+            'hits': hits,
+            'total_ms': total * 1000,
+            'mean_us': total / len(texts) * 1e6 if texts else 0.0,
+            'max_ms': slowest * 1000,
+            'suspect': suspect,
+        })
+    return pl.DataFrame(rows, schema_overrides={'suspect': pl.String}).sort('total_ms', descending=True)
+
+##########################
+##### SAMPLE PREVIEW #####
+##########################
+PREVIEW_SAMPLE_ROWS = 300
+PREVIEW_STRATA = 5
+
+def stratified_sample(df: pl.DataFrame, columns: list, n: int=PREVIEW_SAMPLE_ROWS, seed: int=0,
+                      strata: int=PREVIEW_STRATA) -> pl.DataFrame:
+    """Random sample of about `n` rows, drawn proportionally from `strata` text length quantiles
+    of `columns` so short, long and empty rows are all represented. Row order is kept.
+    """
+    if df.height <= n:
+        return df
+    length = pl.sum_horizontal(pl.col(column).cast(pl.String).str.len_chars().fill_null(0) for column in columns)
+    fraction = n / df.height
+    return (df.with_columns(length.qcut(strata, allow_duplicates=True).alias('__stratum__'))
+              .filter(pl.int_range(pl.len()).shuffle(seed=seed).over('__stratum__')
+                      < (pl.len().over('__stratum__') * fraction).ceil())
+              .drop('__stratum__'))
+
+def preview_sample(df: pl.DataFrame,
+                   input_cols: list,
+                   output_cols: list,
+                   n: int=PREVIEW_SAMPLE_ROWS,
+                   seed: int=0,
+                   deduplicate: bool=True,
+                   workers: int=1,
+                   **options) -> tuple:
+    """Preprocess a stratified sample of `input_cols` and project the cost of the full run.
+
+    The sample is processed in-process without the disk cache, so the measured time is the
+    real per-text cost. The projection scales it by the number of texts the full run
+    preprocesses (unique non-null texts with `deduplicate`) divided over `workers`, and the
+    output memory by the sampled output bytes per row.
+    Returns:
+        tuple[pl.DataFrame, dict]: The processed sample and per input column estimates
+            (texts, unique_ratio, seconds, memory_bytes), plus sample_rows and sample_seconds.
+    """
+    sample = stratified_sample(df, input_cols, n=n, seed=seed)
+    # Warm the tokenizer and pattern set up outside of the timing.
+    preprocess_columns(sample.head(1), input_cols, output_cols, deduplicate=deduplicate, workers=1, **options)
+    start = time.perf_counter()
+    processed, _ = preprocess_columns(sample, input_cols, output_cols, deduplicate=deduplicate, workers=1, **options)
+    sample_seconds = time.perf_counter() - start
+
+    sample_texts = 0
+    for input_col in input_cols:
+        texts = sample.get_column(input_col).drop_nulls()
+        sample_texts += texts.n_unique() if deduplicate else texts.len()
+    per_text = sample_seconds / sample_texts if sample_texts else 0.0
+
+    estimates = {}
+    for input_col, output_col in zip(input_cols, output_cols):
+        series = df.get_column(input_col)
+        non_null = series.len() - series.null_count()
+        texts = series.drop_nulls().n_unique() if deduplicate else non_null
+        estimates[input_col] = {
+            'texts': texts,
+            'unique_ratio': series.drop_nulls().n_unique() / non_null if non_null else 0.0,
+            'seconds': per_text * texts / max(workers or os.cpu_count() or 1, 1),
+            'memory_bytes': processed.get_column(output_col).estimated_size() / max(sample.height, 1) * df.height,
+        }
+    return processed, {'sample_rows': sample.height, 'sample_seconds': sample_seconds, 'columns': estimates}
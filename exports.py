@@ -0,0 +1,148 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import polars as pl
+
+import core
+
+EXPORT_CHUNK_ROWS = 100_000
+EXPORT_CACHE_MAX_BYTES = int(os.environ.get('EXPORT_CACHE_MAX_BYTES', 512 * 1024 ** 2))
+
+
+class ExportJob:
+    """State of one background export build, polled by the app."""
+    def __init__(self, key):
+        self.key = key
+        self.status = 'running'
+        self.progress = 0.0
+        self.data = None
+        self.error = None
+        self.started = time.time()
+        self.elapsed = None
+
+    def set_progress(self, progress: float) -> None:
+        self.progress = min(max(progress, 0.0), 1.0)
+
+
+class ExportManager:
+    """Builds export files on demand in background threads and keeps the resulting bytes.
+
+    Jobs are keyed by (frame fingerprint, format, options), so the same export is built
+    once no matter how many reruns or sessions ask for it. Finished jobs beyond
+    `max_entries` or `max_bytes` of built data are evicted least recently used first.
+    """
+    def __init__(self, max_entries: int=16, max_workers: int=2, max_bytes: int=EXPORT_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='export')
+
+    def get(self, key):
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None:
+                self._jobs.move_to_end(key)
+            return job
+
+    def submit(self, key, builder, *args, **kwargs) -> ExportJob:
+        """Start `builder(*args, progress=job.set_progress, **kwargs)` unless `key` is already built or running."""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.status != 'error':
+                self._jobs.move_to_end(key)
+                return job
+            job = self._jobs[key] = ExportJob(key)
+            self._evict()
+        self._executor.submit(self._run, job, builder, args, kwargs)
+        return job
+
+    def _run(self, job, builder, args, kwargs) -> None:
+        try:
+            job.data = builder(*args, progress=job.set_progress, **kwargs)
+            job.progress = 1.0
+            job.status = 'done'
+        except Exception as error:
+            job.error = error
+            job.status = 'error'
+        job.elapsed = time.time() - job.started
+        with self._lock:
+            self._evict(keep=job.key)
+
+    def _evict(self, keep=None) -> None:
+        finished = [key for key, job in self._jobs.items() if job.status != 'running']
+        for key in finished[:max(len(self._jobs) - self.max_entries, 0)]:
+            del self._jobs[key]
+        size = self._nbytes()
+        for key in [key for key, job in self._jobs.items() if job.status != 'running' and key != keep]:
+            if size <= self.max_bytes:
+                break
+            size -= len(self._jobs.pop(key).data or b'')
+
+    def _nbytes(self) -> int:
+        return sum(len(job.data or b'') for job in self._jobs.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'entries': len(self._jobs),
+                    'running': sum(job.status == 'running' for job in self._jobs.values()),
+                    'bytes': self._nbytes(),
+                    'max_bytes': self.max_bytes}
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in [key for key, job in self._jobs.items() if job.status != 'running']:
+                del self._jobs[key]
+
+
+def build_csv(df: pl.DataFrame, progress=None, columns=None, chunk_rows: int=EXPORT_CHUNK_ROWS) -> bytes:
+    if columns:
+        df = df.select(columns)
+    df = core.join_token_lists(df)
+    buffer = BytesIO()
+    for offset in range(0, max(df.height, 1), chunk_rows):
+        df.slice(offset, chunk_rows).write_csv(buffer, include_header=offset == 0)
+        if progress is not None:
+            progress(min(offset + chunk_rows, df.height) / max(df.height, 1))
+    return buffer.getvalue()
+
+
+def build_xlsx(df: pl.DataFrame, progress=None, columns=None) -> bytes:
+    buffer = BytesIO()
+    core.write_xlsx(df, buffer, columns=columns, progress_callback=progress)
+    return buffer.getvalue()
+
+
+def build_parquet(df: pl.DataFrame, progress=None, columns=None, compression: str='zstd') -> bytes:
+    """Parquet keeps token-list columns as native list types."""
+    buffer = BytesIO()
+    (df.select(columns) if columns else df).write_parquet(buffer, compression=compression)
+    return buffer.getvalue()
+
+
+def build_ipc(df: pl.DataFrame, progress=None, columns=None, compression: str='uncompressed') -> bytes:
+    """Arrow IPC/Feather. Leave uncompressed so downstream jobs can memory-map it."""
+    buffer = BytesIO()
+    (df.select(columns) if columns else df).write_ipc(buffer, compression=compression)
+    return buffer.getvalue()
+
+
+def build_html_table(df: pl.DataFrame, progress=None, **options) -> bytes:
+    return core.to_html_highlight_table(df, **options)
+
+
+BUILDERS = {
+    'csv': build_csv,
+    'xlsx': build_xlsx,
+    'parquet': build_parquet,
+    'ipc': build_ipc,
+    'html': build_html_table,
+}
+
+
+def export_key(fingerprint: str, export_format: str, **options) -> tuple:
+    return (fingerprint, export_format, tuple(sorted((name, repr(value)) for name, value in options.items())))
@@ -0,0 +1,180 @@
+import itertools
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+import core
+
+LARGE_JOB_TEXTS = int(os.environ.get('LARGE_JOB_TEXTS', 200_000))
+
+
+class Job:
+    """State of one queued or running preprocessing job, polled by the session that submitted it."""
+    def __init__(self, session_id, func, args, kwargs, size: int=0, large: bool=False):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.size = size
+        self.large = large
+        self.status = 'queued'
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.elapsed = None
+        self.cancel_event = threading.Event()
+
+    def set_progress(self, done, total) -> None:
+        self.progress = min(done / total, 1.0) if total else 1.0
+
+    def release(self) -> None:
+        """Drop the references to the inputs (the session's frame and ResultStore) once the job is over."""
+        self.func = None
+        self.args = ()
+        self.kwargs = {}
+
+
+class JobScheduler:
+    """Runs preprocessing jobs of every session on one bounded process pool.
+
+    Queued jobs are picked round-robin across sessions and FIFO within a session, so one
+    analyst submitting several jobs cannot starve the others. At most `max_running` jobs run
+    at once and at most `max_large` of them may be large (`size` >= `large_size` texts).
+    Jobs run on scheduler threads, never on the session's script thread; sessions poll
+    `get(job_id)` for status, queue position and progress.
+    Args:
+        max_workers (int, optional): Size of the shared process pool, defaults to the number of CPUs.
+        max_running (int, optional): Jobs running at the same time.
+        max_large (int, optional): Large jobs running at the same time.
+        large_size (int, optional): Number of texts from which a job counts as large.
+        max_finished (int, optional): Finished jobs kept for their sessions to collect.
+    """
+    def __init__(self, max_workers: int=None, max_running: int=2, max_large: int=1,
+                 large_size: int=LARGE_JOB_TEXTS, max_finished: int=32):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_large = max_large
+        self.large_size = large_size
+        self.max_finished = max_finished
+        self._executor = core.process_pool(self.max_workers)
+        self._queues = OrderedDict()
+        self._jobs = OrderedDict()
+        self._running = []
+        self._condition = threading.Condition()
+        for i in range(max_running):
+            threading.Thread(target=self._run_forever, name=f'preprocess-job-{i}', daemon=True).start()
+
+    def submit(self, session_id, func, *args, size: int=0, **kwargs) -> Job:
+        """Queue `func(*args, executor=, cancel_event=, progress_callback=, **kwargs)` for `session_id`.
+
+        `func` is `core.preprocess_columns` or `core.stream_preprocess_csv`; `size` is the
+        number of texts, used for the large job cap.
+        """
+        job = Job(session_id, func, args, kwargs, size=size, large=size >= self.large_size)
+        with self._condition:
+            self._jobs[job.id] = job
+            self._queues.setdefault(session_id, deque()).append(job)
+            self._condition.notify()
+        return job
+
+    def get(self, job_id):
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    def pop(self, job_id):
+        """Forget a finished job once its session has collected the result."""
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is not None and job.status not in ('queued', 'running'):
+                del self._jobs[job_id]
+            return job
+
+    def position(self, job: Job) -> int:
+        """Number of queued jobs picked before `job` in round-robin order, 0 once it runs."""
+        with self._condition:
+            if job.status != 'queued':
+                return 0
+            queues = [list(queue) for queue in self._queues.values()]
+            ahead = 0
+            for depth in itertools.count():
+                for queue in queues:
+                    if depth < len(queue):
+                        if queue[depth] is job:
+                            return ahead
+                        ahead += 1
+                if depth >= max(map(len, queues), default=0):
+                    return ahead
+
+    def cancel(self, job_id) -> None:
+        """Drop a queued job, or stop a running one after the chunks already on the pool."""
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            if job.status == 'queued':
+                queue = self._queues[job.session_id]
+                queue.remove(job)
+                if not queue:
+                    del self._queues[job.session_id]
+                job.status = 'cancelled'
+                job.release()
+            job.cancel_event.set()
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {'queued': sum(map(len, self._queues.values())),
+                    'running': len(self._running),
+                    'large_running': sum(job.large for job in self._running),
+                    'max_workers': self.max_workers}
+
+    def _next_job(self):
+        large_running = sum(job.large for job in self._running)
+        for session_id, queue in self._queues.items():
+            if queue[0].large and large_running >= self.max_large:
+                continue
+            job = queue.popleft()
+            del self._queues[session_id]
+            if queue:
+                self._queues[session_id] = queue
+            return job
+        return None
+
+    def _run_forever(self) -> None:
+        while True:
+            with self._condition:
+                job = self._next_job()
+                while job is None:
+                    self._condition.wait()
+                    job = self._next_job()
+                job.status = 'running'
+                job.started = time.time()
+                self._running.append(job)
+            try:
+                job.result = job.func(*job.args,
+                                      executor=self._executor,
+                                      cancel_event=job.cancel_event,
+                                      progress_callback=job.set_progress,
+                                      **job.kwargs)
+                job.progress = 1.0
+                job.status = 'done'
+            except core.PreprocessCancelled:
+                job.status = 'cancelled'
+            except Exception as error:
+                # The traceback's frames would keep the inputs alive as well.
+                job.error = error.with_traceback(None)
+                job.status = 'error'
+            job.elapsed = time.time() - job.started
+            job.release()
+            with self._condition:
+                self._running.remove(job)
+                self._evict()
+                self._condition.notify_all()
+
+    def _evict(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.status not in ('queued', 'running')]
+        for job_id in finished[:max(len(finished) - self.max_finished, 0)]:
+            del self._jobs[job_id]
@@ -0,0 +1,23 @@
+import re
+
+from core import PatternMatcher
+
+
+def test_combined_only_first_pattern_in_list_order_wins():
+    matcher = PatternMatcher([('ab', 'X'), ('abc', 'Y')])
+    assert matcher.find('abc') == [(0, 2, 0)]
+
+
+def test_hits_inside_a_losing_combined_hit_are_kept():
+    matcher = PatternMatcher([(re.compile('bcd', re.I), 'X'), ('cdefg', 'Y'), ('ef', 'Z')])
+    assert matcher.find('abcdefg') == [(1, 4, 0), (4, 6, 2)]
+
+
+def test_separate_and_combined_follow_leftmost_then_list_order():
+    matcher = PatternMatcher([('ab', 'X'), ('abc', 'Y'), ('(?i)B', 'Z'), (r'(c)\1', 'W')])
+    assert matcher.find('abc bcc ABC') == [(0, 2, 0), (4, 5, 2), (5, 7, 3), (9, 10, 2)]
+
+
+def test_empty_matches_are_skipped():
+    matcher = PatternMatcher([(re.compile('a*', re.I), 'X'), ('b', 'Y')])
+    assert matcher.find('xbaab') == [(1, 2, 1), (2, 4, 0), (4, 5, 1)]
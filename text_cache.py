@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = os.environ.get('TEXT_CACHE_PATH', os.path.join('.cache', 'preprocess_cache.sqlite'))
+DEFAULT_CACHE_MAX_BYTES = int(os.environ.get('TEXT_CACHE_MAX_BYTES', 512 * 1024 ** 2))
+
+_BATCH_SIZE = 900
+
+
+def _digest(*parts: str) -> bytes:
+    hasher = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        hasher.update(part.encode('utf-8'))
+        hasher.update(b'\x1f')
+    return hasher.digest()
+
+
+class TextCache:
+    """Content-addressed SQLite cache of preprocessed texts with size-bounded LRU eviction.
+
+    Entries are keyed by hash(version, options, text). `version` should change whenever
+    the preprocessing library or the pattern list changes, so stale results are never hit
+    and are removed by `purge_stale`.
+    Args:
+        path (str): SQLite file path, created if missing.
+        max_bytes (int): Approximate upper bound of stored values before LRU eviction.
+    """
+    def __init__(self, path: str=DEFAULT_CACHE_PATH, max_bytes: int=DEFAULT_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('''CREATE TABLE IF NOT EXISTS entries (
+                                    key BLOB PRIMARY KEY,
+                                    version TEXT NOT NULL,
+                                    value TEXT NOT NULL,
+                                    size INTEGER NOT NULL,
+                                    last_used REAL NOT NULL)''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)')
+            self._size = self._total_size()
+
+    @staticmethod
+    def options_key(**options) -> str:
+        return json.dumps(options, sort_keys=True, default=str)
+
+    def get_many(self, version: str, options: str, texts: list) -> dict:
+        """Return {text: value} for the texts found in the cache and mark them as recently used."""
+        keys = {_digest(version, options, text): text for text in texts}
+        found = {}
+        with self._lock:
+            key_list = list(keys)
+            for i in range(0, len(key_list), _BATCH_SIZE):
+                batch = key_list[i:i + _BATCH_SIZE]
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM entries WHERE key IN ({','.join('?' * len(batch))})",
+                    batch).fetchall()
+                for key, value in rows:
+                    found[keys[key]] = json.loads(value)
+            if found:
+                now = time.time()
+                with self._conn:
+                    self._conn.executemany('UPDATE entries SET last_used = ? WHERE key = ?',
+                                           ((now, _digest(version, options, text)) for text in found))
+        return found
+
+    def set_many(self, version: str, options: str, items) -> None:
+        """Store (text, value) pairs, then evict least recently used entries above `max_bytes`."""
+        now = time.time()
+        rows = {}
+        for text, value in items:
+            value = json.dumps(value, ensure_ascii=False)
+            key = _digest(version, options, text)
+            rows[key] = (key, version, value, len(value.encode('utf-8')), now)
+        with self._lock, self._conn:
+            replaced = self._stored_size(list(rows))
+            self._conn.executemany('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)', rows.values())
+            self._size += sum(row[3] for row in rows.values()) - replaced
+            self._evict()
+
+    def _total_size(self) -> int:
+        return self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def _stored_size(self, keys: list) -> int:
+        size = 0
+        for i in range(0, len(keys), _BATCH_SIZE):
+            batch = keys[i:i + _BATCH_SIZE]
+            size += self._conn.execute(
+                f"SELECT COALESCE(SUM(size), 0) FROM entries WHERE key IN ({','.join('?' * len(batch))})",
+                batch).fetchone()[0]
+        return size
+
+    def _evict(self) -> None:
+        """Delete the least recently used entries until the running total fits `max_bytes`.
+
+        Ties on `last_used` (a batch shares one timestamp) are broken on rowid, so the rows
+        just written go last and only the oldest rows are read, a batch at a time.
+        """
+        while self._size > self.max_bytes:
+            rows = self._conn.execute('SELECT rowid, size FROM entries ORDER BY last_used, rowid LIMIT ?',
+                                      (_BATCH_SIZE,)).fetchall()
+            if not rows:
+                self._size = 0
+                return
+            doomed = []
+            for rowid, size in rows:
+                if self._size <= self.max_bytes:
+                    break
+                doomed.append(rowid)
+                self._size -= size
+            self._conn.execute(f"DELETE FROM entries WHERE rowid IN ({','.join('?' * len(doomed))})", doomed)
+
+    def purge_stale(self, valid_versions) -> int:
+        """Delete entries whose version is not in `valid_versions`. Returns the number of deleted rows."""
+        valid_versions = list(valid_versions)
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                f"DELETE FROM entries WHERE version NOT IN ({','.join('?' * len(valid_versions))})",
+                valid_versions)
+            self._size = self._total_size()
+        return cursor.rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+            # Resync the running total with rows written by other processes sharing the file.
+            self._size = size
+        return {'entries': entries, 'bytes': size, 'max_bytes': self.max_bytes, 'path': self.path}
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM entries')
+            self._size = 0
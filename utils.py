@@ -1,197 +1,57 @@
-from ThaiTextPrepKit import typo_patterns as TYPO
-from ThaiTextPrepKit.polars_pretextkit import thai_text_preprocessing, preprocess_text_batches
-import polars as pl
-import streamlit as st
-import pandas as pd
-from io import BytesIO
-import re
-import mmh3
-import openpyxl
-
-available_patterns = {
-    'default': TYPO.patterns,
-    'natural': TYPO.natural_patterns,
-    'corporate': TYPO.corp_patterns,
-}
-
-def hash_dataframe(df: pl.DataFrame, seed=42) -> str:
-    """Hash a polars DataFrame. Due to the behaviour of pl.DataFrame.hash_rows 
-    this will only be consistent given a polars version.
-    Args:
-        df (pl.DataFrame): polars DataFrame to be hashed.
-        seed (int, optional): Seed for the hash function.
-    Returns:
-        str: Hash of the polars DataFrame.
-    """
-    row_hashes = df.hash_rows(seed=seed)
-    hasher = mmh3.mmh3_x64_128(seed=seed)
-    for row_hash in row_hashes:
-        hasher.update(row_hash.to_bytes(64, "little"))
-    return hasher.digest().hex()
-
-@st.cache_data(hash_funcs={pl.DataFrame: hash_dataframe})
-def load_uploaded_file(uploaded_file, file_type, selected_sheet=None):
-    if file_type == 'text/csv':
-        dataframe = pl.read_csv(uploaded_file)
-        return dataframe
-
-    elif file_type == 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet':
-        workbook = openpyxl.load_workbook(uploaded_file)
-        return workbook
-    
-    elif file_type == 'excel':
-        dataframe = pl.read_excel(uploaded_file,
-                        sheet_name=selected_sheet,
-                        engine='calamine',
-                        infer_schema_length=None)
-        return dataframe
-
-@st.cache_data(hash_funcs={pl.DataFrame: hash_dataframe})
-def preprocess(df, 
-               input_col,
-               output_col,
-               custom_dict=None,
-               keep_stopwords: bool=True,
-               keep_format: bool=True,
-               return_token_list: bool=False,
-               patterns=None,
-               **kwargs):
-    patterns = available_patterns.get(patterns)
-    df = df.pipe(thai_text_preprocessing,
-                                 input_col,
-                                 output_col,
-                                 custom_dict=custom_dict,
-                                 keep_stopwords=keep_stopwords,
-                                 keep_format=keep_format,
-                                 return_token_list=return_token_list,
-                                 patterns=patterns,
-                                 **kwargs)
-    
-    return df #df.to_pandas()
-
-@st.cache_data(hash_funcs={pl.DataFrame: hash_dataframe})
-def sigle_text_preprocessing(text,
-                            keep_stopwords: bool=True,
-                            keep_format: bool=True,
-                            return_token_list: bool=False,
-                            lower_case: bool=False,
-                            include_pattern: str=None,
-                            patterns=None,):
-    
-    patterns = available_patterns.get(patterns)
- 
-    pre_series = preprocess_text_batches(series=pl.Series([text]),
-                                   #custom_dict=None,
-                                   keep_stopwords=keep_stopwords,
-                                   keep_format=keep_format,
-                                   return_token_list=return_token_list,
-                                   lower_case=lower_case,
-                                   include_pattern=include_pattern,
-                                   patterns=patterns)
-    return pre_series
+"""Streamlit layer over `core`: caches the core functions with st.cache_data for the app.
 
-@st.cache_data(hash_funcs={pl.DataFrame: hash_dataframe})
-def convert_to_csv(df: pl.DataFrame):
-    # IMPORTANT: Cache the conversion to prevent computation on every rerun
-    return df.write_csv() #df.to_csv().encode("utf-8")
+Every cache is bounded by `max_entries` (least recently used entries are evicted first)
+and expires after CACHE_TTL seconds. Preprocessing and exports do not go through
+st.cache_data: results live in the session's ResultStore and exports in the ExportManager.
+"""
+import os
 
-@st.cache_data(hash_funcs={pl.DataFrame: hash_dataframe})
-def convert_to_xlsx(df: pl.DataFrame):
-    buffer = BytesIO()
-    with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
-        # Write each dataframe to a different worksheet.
-        df.to_pandas().to_excel(writer, sheet_name='Sheet1', index=False)
-    return buffer
-
-##################################
-##### FOR HTML COMPARE TABLE #####
-##################################
-def highlight_patterns(patterns, text, html=True, highlight_color_replace="#FFFF00", highlight_color_match="#00FFFF"):
-    """
-    Highlights all occurrences of the given regex patterns in the text using HTML <span> tags with background color.
-
-    :param patterns: A list of tuples containing regex patterns and their replacements.
-    :param text: The text to search within.
-    :param highlight_color_replace: The background color to use for replacements (default is yellow).
-    :param highlight_color_match: The background color to use for matches without replacement (default is blue).
-    :return: The text with highlighted matches.
-    """
-    def add_highlight(match, color):
-        return f'<span style="background-color: {color};">{match.group(0)}</span>' if html else f'<typo>{match.group(0)}</typo>'
-    
-    highlighted_text = text
-    for pattern, replacement in patterns:
-        matches = list(re.finditer(pattern, text))
-        replacement = replacement.lstrip('<IGNORE>').rstrip('</IGNORE>')
-        #print(replacement)
-        if matches:
-            for match in matches:
-                if replacement in match.group(0):
-                    highlighted_text = highlighted_text.replace(match.group(0), add_highlight(match, highlight_color_match))
-                else:
-                    highlighted_text = highlighted_text.replace(match.group(0), add_highlight(match, highlight_color_replace))
-    
-    return highlighted_text
-
-def generate_html_table(*args):
-    """
-    Generate an HTML table with columns for each text list provided, using the given names as headers.
-
-    Args:
-    - *args (tuple): Variable number of tuples, each containing a list of texts and a corresponding name.
-
-    Returns:
-    - html_content (str): String containing the HTML table.
-    """
-    headers = [name for _, name in args]
-    
-    html_content = "<table border='1'>\n"
-    html_content += "<tr>" + "".join(f"<th>{header}</th>" for header in headers) + "</tr>\n"
-    
-    # Find the maximum length among the provided lists to handle uneven lengths
-    max_length = max(len(text_list) for text_list, _ in args)
-    
-    for i in range(max_length):
-        html_content += "<tr>"
-        for text_list, _ in args:
-            cell_content = text_list[i] if i < len(text_list) else ""
-            html_content += f"<td>{cell_content}</td>"
-        html_content += "</tr>\n"
+import polars as pl
+import streamlit as st
 
-    html_content += "</table>"
-    
-    return html_content
+import core
+from core import (
+    ResultStore,
+    get_text_cache,
+    hash_dataframe,
+    sample_texts,
+    spool_upload,
+)
 
-def get_highlight_texts(patterns, texts: list) -> None:
-    html_text = []
-    for text in texts:
-        html_text.append(highlight_patterns(patterns, text))
-    return html_text
+CACHE_TTL = int(os.environ.get('CACHE_TTL_SECONDS', 60 * 60))
 
-@st.cache_data(hash_funcs={pl.DataFrame: hash_dataframe})
-def to_html_highlight_table(df, patterns, raw_column, preprocess_column):
-    patterns = available_patterns.get(patterns)
+@st.cache_data(hash_funcs={pl.DataFrame: hash_dataframe}, max_entries=4, ttl=CACHE_TTL)
+def load_uploaded_file(uploaded_file, file_type, selected_sheet=None, columns=None):
+    return core.load_file(uploaded_file, file_type, selected_sheet=selected_sheet, columns=columns)
 
-    df = df.drop_nulls([raw_column, preprocess_column])
+@st.cache_resource
+def get_interactive_engine():
+    """One warm InteractiveEngine per server process, shared by every session."""
+    return core.InteractiveEngine()
 
-    # Generate HTML table
-    html_table = generate_html_table(
-        (get_highlight_texts(patterns, df.get_column(raw_column).to_list()), 'Raw Text'),
-        (get_highlight_texts(patterns, df.get_column(preprocess_column).to_list()), "PAREPA"),
-        )
-    
-    return html_table
+@st.cache_data(hash_funcs={pl.DataFrame: hash_dataframe}, max_entries=16, ttl=CACHE_TTL)
+def preview_sample(_df, fingerprint, input_cols, output_cols, **kwargs):
+    """`fingerprint` (the ResultStore fingerprint of `_df`) stands in for the frame in the cache key."""
+    return core.preview_sample(_df, input_cols, output_cols, **kwargs)
 
-@st.cache_data(hash_funcs={pl.DataFrame: hash_dataframe})
+@st.cache_data(hash_funcs={pl.DataFrame: hash_dataframe}, max_entries=8, ttl=CACHE_TTL)
 def get_patterns_table(patterns):
-    patterns = available_patterns.get(patterns)
-    replacements = []
-    #regex_patterns = []
-    for pattern, replacement in patterns:
-        #regex_patterns.append(pattern.pattern)
-        replacements.append(replacement if replacement != '' else None)
-    data_dict = {
-        #'regex': regex_patterns,
-        'replacement': replacements
-    }
-    return pl.DataFrame(data_dict).drop_nulls(['replacement'])
\ No newline at end of file
+    return core.get_patterns_table(patterns)
+
+@st.cache_data(hash_funcs={pl.DataFrame: hash_dataframe}, max_entries=8, ttl=CACHE_TTL)
+def profile_patterns(patterns, texts: list):
+    return core.profile_patterns(patterns, texts)
+
+def cache_data_stats() -> pl.DataFrame:
+    """Entries and pickled bytes held by each st.cache_data function in this server process."""
+    from streamlit.runtime.caching import get_data_cache_stats_provider
+    stats = [stat for family in get_data_cache_stats_provider().get_stats().values() for stat in family]
+    return (pl.DataFrame({'function': [stat.cache_name for stat in stats],
+                          'bytes': [stat.byte_length for stat in stats]},
+                         schema={'function': pl.String, 'bytes': pl.Int64})
+              .group_by('function')
+              .agg(pl.len().alias('entries'), pl.col('bytes').sum())
+              .sort('bytes', descending=True))
+
+def clear_data_caches() -> None:
+    st.cache_data.clear()